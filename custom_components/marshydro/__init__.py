@@ -2,15 +2,28 @@
 import asyncio
 import logging
 import re
+import time
 from datetime import timedelta
 
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
 from homeassistant.components import bluetooth
+from homeassistant.util import dt as dt_util
 
-from .const import DOMAIN
+from .const import (
+    CONF_HEDGE_READS,
+    CONF_MAX_POLL_INTERVAL,
+    CONF_MIN_POLL_INTERVAL,
+    DEFAULT_MAX_POLL_INTERVAL,
+    DEFAULT_MIN_POLL_INTERVAL,
+    DOMAIN,
+    STORAGE_KEY,
+    STORAGE_VERSION,
+)
 from .api_marspro import MarsProAPI
 
 _LOGGER = logging.getLogger(__name__)
@@ -19,6 +32,23 @@ PLATFORMS: list[Platform] = [Platform.LIGHT]
 
 SCAN_INTERVAL = timedelta(seconds=30)
 
+# Liste complète (découverte des ajouts / suppressions) à un rythme plus lent ;
+# entre-temps, chaque appareil connu est rafraîchi via getDeviceDetail
+FULL_REFRESH_INTERVAL = timedelta(minutes=5)
+DETAIL_POLL_MAX_DEVICES = 8  # Au-delà, une liste complète coûte moins de requêtes
+
+# Intervalle de rafraîchissement adaptatif : rapide juste après une commande,
+# puis backoff exponentiel tant que l'état ne change pas, entre min et max
+# (DEFAULT_MIN/MAX_POLL_INTERVAL, réglables dans les options de l'entrée)
+FAST_POLL_WINDOW = timedelta(seconds=60)
+MAX_UNCHANGED_BACKOFF_STEPS = 10
+
+# Nouveau scan BLE après un échec : backoff exponentiel plafonné
+BLE_RESCAN_INITIAL = timedelta(minutes=1)
+BLE_RESCAN_MAX = timedelta(hours=1)
+# Écart minimal entre deux scans anticipés déclenchés par des annonces
+BLE_EARLY_RESCAN_MIN = timedelta(minutes=1)
+
 
 class MarsHydroBLEPureCoordinator(DataUpdateCoordinator):
     """Coordinateur BLE pur pour MarsHydro sans dépendance cloud."""
@@ -33,6 +63,7 @@ class MarsHydroBLEPureCoordinator(DataUpdateCoordinator):
         )
         self.configured_ble_devices = ble_devices
         self.devices = []
+        self._devices_by_type = {}  # Index par type d'entité
         self.ble_connections = {}
         self.ble_characteristics = {}  # Cache des caractéristiques BLE
 
@@ -75,6 +106,9 @@ class MarsHydroBLEPureCoordinator(DataUpdateCoordinator):
                 )
             
             self.devices = processed_devices
+            self._devices_by_type = {}
+            for device in processed_devices:
+                self._devices_by_type.setdefault(device['entity_type'], []).append(device)
             
             return {
                 "devices": processed_devices,
@@ -87,7 +121,7 @@ class MarsHydroBLEPureCoordinator(DataUpdateCoordinator):
 
     def get_devices_by_type(self, entity_type: str):
         """Récupérer les appareils par type d'entité."""
-        return [device for device in self.devices if device['entity_type'] == entity_type]
+        return list(self._devices_by_type.get(entity_type, ()))
 
     async def establish_ble_connection(self, device_address: str):
         """Établir connexion BLE pour appareil pur."""
@@ -241,7 +275,13 @@ class MarsHydroDataUpdateCoordinator(DataUpdateCoordinator):
     - Nom BLE: "MH-DIMBOX", Adresse: 34:5F:45:EC:73:CE ≈ PID 345F45EC73CC
     """
 
-    def __init__(self, hass: HomeAssistant, api: MarsProAPI) -> None:
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        api: MarsProAPI,
+        min_interval: timedelta = DEFAULT_MIN_POLL_INTERVAL,
+        max_interval: timedelta = DEFAULT_MAX_POLL_INTERVAL,
+    ) -> None:
         """Initialize the coordinator."""
         super().__init__(
             hass,
@@ -250,100 +290,486 @@ class MarsHydroDataUpdateCoordinator(DataUpdateCoordinator):
             update_interval=SCAN_INTERVAL,
         )
         self.api = api
+        # Intervalle adaptatif (l'intervalle effectif est update_interval)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._fast_poll_until = 0
+        self._unchanged_polls = 0
         self.devices = []
         self.bluetooth_devices = {}
         self.ble_connections = {}  # Tracking des connexions BLE actives
         self.is_bluetooth_device = False
-        self.ble_scan_failed = False
+        self.ble_scan_failures = 0  # Scans consécutifs sans corrélation complète
+        self.next_ble_scan = None  # Prochain scan planifié (UTC), None si aucun
+        self._ble_rescan_unsub = None
+        self._last_early_ble_scan = None  # Dernier scan anticipé (monotonic)
+        self._page_task = None  # Pages de la liste encore en cours au démarrage
+        self._ble_scan_task = None  # Scan BLE actif, hors du cycle de rafraîchissement
+        self._ble_unsubscribe = None  # Annonces BLE passives de Home Assistant
+        self._device_map = {}  # Dernière carte publiée (par ID d'appareil)
+        self._snapshot = {}  # Copie de la carte publiée, base du diff suivant
+        self.changed_device_ids = None  # None : toutes les entités sont notifiées
+        self.last_diff = {"changed": 0, "unchanged": 0, "removed": 0}
+
+        # Index des appareils (reconstruits seulement si l'ensemble change)
+        self._index_signature = None
+        self._ids_by_pid = {}
+        self._ids_by_type = {}
+        self._bluetooth_ids_by_pid = {}  # PID en minuscules ≈ adresse MAC sans ":"
+        self._bluetooth_pid_chunks = set()
+        self._first_bluetooth_id = None
+        # Corrélations BLE ↔ cloud, conservées d'un rafraîchissement à l'autre
+        self._ble_address_by_pid = {}
+        self._pid_by_ble_address = {}
+        self._last_full_refresh = None
+
+        # Vérifier l'état réel de l'appareil après chaque commande réussie
+        self._command_unsub = api.add_command_listener(self._async_command_sent)
 
     async def _async_update_data(self):
+        """Fetch data from API endpoint and adapt the polling interval."""
+        data = await self._async_fetch_devices()
+
+        if self.last_diff["changed"] or self.last_diff["removed"]:
+            self._unchanged_polls = 0
+        else:
+            self._unchanged_polls += 1
+        self._update_poll_interval()
+        return data
+
+    async def _async_fetch_devices(self):
         """Fetch data from API endpoint and detect devices."""
+        if self._page_task is not None and not self._page_task.done():
+            # Premier chargement en cours : il publie lui-même la carte, ne pas la concurrencer
+            _LOGGER.debug("Device list still loading, skipping this poll")
+            self.changed_device_ids = set()
+            self.last_diff = {"changed": 0, "unchanged": len(self._device_map), "removed": 0}
+            return self.data
+
         try:
+            if not self._full_refresh_due():
+                data = await self._refresh_known_devices()
+                if data is not None:
+                    return data
+
             _LOGGER.info("Fetching device data from MarsPro API...")
+            self._last_full_refresh = time.monotonic()
             
-            # Récupérer la liste des appareils depuis l'API MarsPro
-            devices = await self.api.get_all_devices()
-            
-            if not devices:
-                _LOGGER.warning("No devices found via MarsPro API")
-                return {"devices": [], "bluetooth_devices": {}}
-            
-            _LOGGER.info(f"Found {len(devices)} devices via MarsPro API")
-            
-            processed_devices = []
-            bluetooth_count = 0
-            
-            # Traiter chaque appareil pour extraction PID et type
-            for device in devices:
-                device_name = device.get('name', '')
-                device_id = device.get('id')
-                
-                if not device_id or not device_name:
-                    _LOGGER.warning(f"Skipping device with missing ID or name: {device}")
-                    continue
-                
-                # Extraire le PID depuis le nom
-                pid_match = re.search(r'([A-F0-9]{12})$', device_name)
-                if not pid_match:
-                    _LOGGER.warning(f"Cannot extract PID from device name: {device_name}")
-                    continue
-                
-                extracted_pid = pid_match.group(1)
-                
-                # Déterminer le type d'entité
-                device_name_lower = device_name.lower()
-                if any(keyword in device_name_lower for keyword in ['light', 'led', 'dimbox', 'lamp']):
-                    entity_type = "light"
-                elif any(keyword in device_name_lower for keyword in ['fan', 'ventil', 'exhaust']):
-                    entity_type = "fan"
-                else:
-                    entity_type = "light"  # fallback vers light
-                
-                # Détecter si c'est un appareil Bluetooth (modèle hybride)
-                is_bluetooth = not device.get('is_net_device', True)
-                
-                if is_bluetooth:
-                    bluetooth_count += 1
-                    self.is_bluetooth_device = True
-                    _LOGGER.info(f"Device {device_name} requires HYBRID BLE+Cloud control")
-                
-                processed_device = {
-                    'id': device_id,
-                    'name': device_name,
-                    'pid': extracted_pid,
-                    'entity_type': entity_type,
-                    'is_bluetooth': is_bluetooth,
-                    'requires_ble_connection': is_bluetooth,  # Nouvelle propriété
-                    'raw_data': device
-                }
-                
-                processed_devices.append(processed_device)
-                
-                _LOGGER.info(
-                    f"Processed device: {device_name} (ID: {device_id}, "
-                    f"PID: {extracted_pid}, Type: {entity_type}, "
-                    f"Bluetooth: {is_bluetooth})"
+            # Récupérer la liste des appareils page par page depuis l'API MarsPro
+            device_map = {}
+            pages = self.api.iter_device_pages()
+            first_page = await anext(pages, None)
+            self._add_device_page(device_map, first_page or [])
+
+            if self.data is None:
+                # Premier rafraîchissement : publier dès la première page, le reste
+                # de la liste complète la carte des appareils en arrière-plan
+                self._page_task = self.hass.async_create_background_task(
+                    self._consume_device_pages(pages, device_map),
+                    f"{DOMAIN}_device_pages",
                 )
-            
-            # Scanner Bluetooth si on a des appareils BLE (modèle hybride)
-            if bluetooth_count > 0 and not self.ble_scan_failed:
-                _LOGGER.info(f"Found {bluetooth_count} Bluetooth devices, scanning BLE...")
-                _LOGGER.info("HYBRID MODEL: These devices need BLE connection + Cloud commands")
-                await self._scan_bluetooth_devices()
-            elif self.ble_scan_failed:
-                _LOGGER.warning("BLE scan previously failed, skipping BLE detection")
-            
-            self.devices = processed_devices
-            
-            return {
-                "devices": processed_devices,
-                "bluetooth_devices": self.bluetooth_devices
-            }
+            else:
+                async for page in pages:
+                    self._add_device_page(device_map, page)
+                self._schedule_ble_scan(device_map)
+
+            if not device_map:
+                _LOGGER.warning("No devices found via MarsPro API")
+
+            return self._publish_devices(device_map)
             
         except Exception as err:
+            # Échec : toutes les entités doivent être notifiées (indisponibilité)
+            self.changed_device_ids = None
             _LOGGER.error(f"Error communicating with API: {err}")
             raise UpdateFailed(f"Error communicating with API: {err}")
 
+    def _update_poll_interval(self):
+        """Choisir l'intervalle du prochain rafraîchissement (bornes min / max)"""
+        if time.monotonic() < self._fast_poll_until:
+            interval = self.min_interval
+        else:
+            steps = min(self._unchanged_polls, MAX_UNCHANGED_BACKOFF_STEPS)
+            interval = SCAN_INTERVAL * 2 ** steps
+        interval = max(self.min_interval, min(self.max_interval, interval))
+
+        if interval != self.update_interval:
+            _LOGGER.debug(f"Polling interval set to {interval.total_seconds():.0f}s")
+            self.update_interval = interval
+
+    @property
+    def poll_status(self):
+        """Intervalle de rafraîchissement effectif et état de l'adaptation (diagnostic)"""
+        return {
+            "effective_interval": self.update_interval.total_seconds(),
+            "min_interval": self.min_interval.total_seconds(),
+            "max_interval": self.max_interval.total_seconds(),
+            "unchanged_polls": self._unchanged_polls,
+            "fast_poll_active": time.monotonic() < self._fast_poll_until,
+        }
+
+    @callback
+    def async_note_command(self):
+        """Une commande vient d'être envoyée : sonder vite pendant FAST_POLL_WINDOW"""
+        self._fast_poll_until = time.monotonic() + FAST_POLL_WINDOW.total_seconds()
+        self._unchanged_polls = 0
+        self._update_poll_interval()
+
+    @callback
+    def _async_command_sent(self, device_id):
+        """Commande réussie : sonder vite, et relire cet appareil seul sans bloquer"""
+        self.async_note_command()
+        self.hass.async_create_task(self.async_refresh_device(device_id))
+
+    def _full_refresh_due(self):
+        """True si la liste complète doit être téléchargée à ce rafraîchissement"""
+        return (
+            self._last_full_refresh is None
+            or not self._device_map
+            or len(self._device_map) > DETAIL_POLL_MAX_DEVICES
+            or time.monotonic() - self._last_full_refresh >= FULL_REFRESH_INTERVAL.total_seconds()
+        )
+
+    async def _refresh_known_devices(self):
+        """Rafraîchir chaque appareil connu via getDeviceDetail.
+
+        Retourne None si un appareil n'a pas pu être rafraîchi (détail absent ou
+        inexploitable) : la liste complète est alors téléchargée, plutôt que de
+        republier un état périmé comme inchangé.
+        """
+        device_ids = list(self._device_map)
+        details = await asyncio.gather(
+            *(self.api.get_device_detail(device_id) for device_id in device_ids)
+        )
+
+        device_map = dict(self._device_map)
+        for device_id, detail in zip(device_ids, details):
+            processed_device = self._process_device(detail) if detail else None
+            if processed_device is None:
+                _LOGGER.warning(
+                    f"Device detail refresh failed for {device_id}, falling back to the full list"
+                )
+                return None
+            device_map[processed_device['id']] = processed_device
+        return self._publish_devices(device_map)
+
+    def get_device(self, device_id):
+        """Dernier état publié d'un appareil (None s'il est inconnu)"""
+        return self._device_map.get(device_id)
+
+    def get_device_by_pid(self, device_pid):
+        """Appareil correspondant à un PID (None s'il est inconnu)"""
+        return self._device_map.get(self._ids_by_pid.get(device_pid))
+
+    def _rebuild_indexes(self):
+        """Reconstruire les index si l'ensemble des appareils (ID, PID, type) a changé"""
+        signature = {
+            device_id: (device['pid'], device['entity_type'], device['is_bluetooth'])
+            for device_id, device in self._device_map.items()
+        }
+        if signature == self._index_signature:
+            return
+        self._index_signature = signature
+
+        self._ids_by_pid = {}
+        self._ids_by_type = {}
+        self._bluetooth_ids_by_pid = {}
+        self._bluetooth_pid_chunks = set()
+        self._first_bluetooth_id = None
+
+        for device_id, (pid, entity_type, is_bluetooth) in signature.items():
+            self._ids_by_pid.setdefault(pid, device_id)
+            self._ids_by_type.setdefault(entity_type, []).append(device_id)
+            if is_bluetooth:
+                cloud_pid = pid.lower()
+                self._bluetooth_ids_by_pid.setdefault(cloud_pid, device_id)
+                self._bluetooth_pid_chunks.update(
+                    cloud_pid[i:i+2] for i in range(0, len(cloud_pid), 2)
+                )
+                if self._first_bluetooth_id is None:
+                    self._first_bluetooth_id = device_id
+
+        _LOGGER.debug(f"Device indexes rebuilt for {len(signature)} devices")
+
+    def _bluetooth_device_for_address(self, ble_address: str):
+        """Appareil cloud Bluetooth dont le PID correspond à l'adresse MAC"""
+        ble_addr_clean = ble_address.replace(":", "").lower()
+        return self._device_map.get(self._bluetooth_ids_by_pid.get(ble_addr_clean))
+
+    def _link_ble_device(self, cloud_device, ble_address: str, ble_name: str, ble_device=None):
+        """Mémoriser la corrélation BLE ↔ cloud (conservée entre rafraîchissements)"""
+        self._ble_address_by_pid[cloud_device['pid']] = ble_address
+        self._pid_by_ble_address[ble_address] = cloud_device['pid']
+        cloud_device['ble_address'] = ble_address
+        cloud_device['ble_name'] = ble_name
+        if ble_device is not None:
+            cloud_device['ble_device'] = ble_device
+
+    async def async_refresh_device(self, device_id):
+        """Rafraîchir un seul appareil (vérification après commande) et publier"""
+        detail = await self.api.get_device_detail(device_id, fresh=True)
+        if not detail:
+            return False
+
+        if self._page_task is not None and not self._page_task.done():
+            # Fusionner dans la carte que le premier chargement complète encore
+            device_map = self._device_map
+        else:
+            device_map = dict(self._device_map)
+        self._add_device_page(device_map, [detail])
+        self.async_set_updated_data(self._publish_devices(device_map))
+        return True
+
+    async def _consume_device_pages(self, pages, device_map):
+        """Intégrer les pages restantes au fil de leur arrivée et les publier"""
+        try:
+            async for page in pages:
+                self._add_device_page(device_map, page)
+                self.async_set_updated_data(self._publish_devices(device_map))
+            self._schedule_ble_scan(device_map)
+        except Exception as err:
+            _LOGGER.error(f"Error fetching remaining device pages: {err}")
+            # Liste incomplète : la redemander entière au prochain rafraîchissement
+            self._last_full_refresh = None
+
+    def _add_device_page(self, device_map, devices):
+        """Traiter une page d'appareils et l'ajouter à la carte (par ID)"""
+        for device in devices:
+            processed_device = self._process_device(device)
+            if processed_device:
+                device_map[processed_device['id']] = processed_device
+
+    def _process_device(self, device):
+        """Extraire PID et type d'un appareil cloud (None s'il est inexploitable)"""
+        device_name = device.get('name', '')
+        device_id = device.get('id')
+        
+        if not device_id or not device_name:
+            _LOGGER.warning(f"Skipping device with missing ID or name: {device}")
+            return None
+        
+        # Extraire le PID depuis le nom
+        pid_match = re.search(r'([A-F0-9]{12})$', device_name)
+        if not pid_match:
+            _LOGGER.warning(f"Cannot extract PID from device name: {device_name}")
+            return None
+        
+        extracted_pid = pid_match.group(1)
+        
+        # Déterminer le type d'entité
+        device_name_lower = device_name.lower()
+        if any(keyword in device_name_lower for keyword in ['light', 'led', 'dimbox', 'lamp']):
+            entity_type = "light"
+        elif any(keyword in device_name_lower for keyword in ['fan', 'ventil', 'exhaust']):
+            entity_type = "fan"
+        else:
+            entity_type = "light"  # fallback vers light
+        
+        # Détecter si c'est un appareil Bluetooth (modèle hybride)
+        is_bluetooth = not device.get('is_net_device', True)
+        
+        if is_bluetooth:
+            self.is_bluetooth_device = True
+            _LOGGER.info(f"Device {device_name} requires HYBRID BLE+Cloud control")
+        
+        _LOGGER.info(
+            f"Processed device: {device_name} (ID: {device_id}, "
+            f"PID: {extracted_pid}, Type: {entity_type}, "
+            f"Bluetooth: {is_bluetooth})"
+        )
+        
+        processed_device = {
+            'id': device_id,
+            'name': device_name,
+            'pid': extracted_pid,
+            'entity_type': entity_type,
+            'is_bluetooth': is_bluetooth,
+            'requires_ble_connection': is_bluetooth,  # Nouvelle propriété
+            'raw_data': device
+        }
+        
+        # Reprendre la corrélation BLE déjà établie pour ce PID
+        ble_address = self._ble_address_by_pid.get(extracted_pid)
+        if ble_address:
+            processed_device['ble_address'] = ble_address
+        
+        return processed_device
+
+    def _schedule_ble_scan(self, device_map):
+        """Lancer un scan BLE en arrière-plan si des appareils BLE restent à corréler.
+
+        Le rafraîchissement cloud n'attend jamais la radio : les corrélations
+        arrivent de façon asynchrone (scan ou annonces passives).
+        """
+        pending = [
+            device for device in device_map.values()
+            if device['is_bluetooth'] and device['pid'] not in self._ble_address_by_pid
+        ]
+        if not pending:
+            return
+        if self.next_ble_scan is not None and dt_util.utcnow() < self.next_ble_scan:
+            _LOGGER.debug(f"BLE scan backing off until {self.next_ble_scan.isoformat()}")
+            return
+        if self._ble_scan_task is not None and not self._ble_scan_task.done():
+            return
+
+        _LOGGER.info(f"Found {len(pending)} uncorrelated Bluetooth devices, scanning BLE in background...")
+        _LOGGER.info("HYBRID MODEL: These devices need BLE connection + Cloud commands")
+        self._cancel_ble_rescan()
+        self._ble_scan_task = self.hass.async_create_background_task(
+            self._run_ble_scan(), f"{DOMAIN}_ble_scan"
+        )
+
+    async def _run_ble_scan(self):
+        """Scanner puis, si des appareils restent non corrélés, replanifier avec backoff"""
+        await self._scan_bluetooth_devices()
+
+        if self._ble_fully_correlated():
+            self._reset_ble_backoff()
+            return
+
+        self.ble_scan_failures += 1
+        delay = min(
+            BLE_RESCAN_MAX.total_seconds(),
+            BLE_RESCAN_INITIAL.total_seconds() * 2 ** (self.ble_scan_failures - 1),
+        )
+        self.next_ble_scan = dt_util.utcnow() + timedelta(seconds=delay)
+        self._ble_rescan_unsub = async_call_later(self.hass, delay, self._async_ble_rescan_due)
+        _LOGGER.warning(
+            f"BLE scan incomplete ({self.ble_scan_failures} consecutive), "
+            f"next scan in {delay:.0f}s"
+        )
+
+    @callback
+    def _async_ble_rescan_due(self, _now):
+        """Fin du backoff : relancer le scan"""
+        self._ble_rescan_unsub = None
+        self.next_ble_scan = None
+        self._schedule_ble_scan(self._device_map)
+
+    def _ble_fully_correlated(self):
+        """True si chaque appareil Bluetooth connu a une adresse BLE"""
+        return all(
+            device['pid'] in self._ble_address_by_pid
+            for device in self._device_map.values() if device['is_bluetooth']
+        )
+
+    def _cancel_ble_rescan(self):
+        """Annuler le scan planifié"""
+        if self._ble_rescan_unsub is not None:
+            self._ble_rescan_unsub()
+            self._ble_rescan_unsub = None
+        self.next_ble_scan = None
+
+    def _reset_ble_backoff(self):
+        """Tous les appareils BLE sont corrélés : plus de scan planifié"""
+        self._cancel_ble_rescan()
+        if self.ble_scan_failures:
+            _LOGGER.info("All Bluetooth devices correlated, BLE re-scan backoff reset")
+        self.ble_scan_failures = 0
+
+    @callback
+    def async_start_ble_discovery(self):
+        """S'abonner aux annonces BLE passives du Bluetooth de Home Assistant"""
+        try:
+            self._ble_unsubscribe = bluetooth.async_register_callback(
+                self.hass,
+                self._async_ble_advertisement,
+                None,
+                bluetooth.BluetoothScanningMode.PASSIVE,
+            )
+        except Exception as err:
+            _LOGGER.warning(f"HA Bluetooth callbacks unavailable, relying on scans: {err}")
+
+    @callback
+    def _async_ble_advertisement(self, service_info, change):
+        """Annonce BLE reçue : mettre à jour l'appareil vu et sa corrélation cloud"""
+        device_name = service_info.name or ""
+        device_address = service_info.address
+        if not self._is_marspro_device_by_name_addr(device_name, device_address):
+            return
+
+        self.bluetooth_devices[device_address] = {
+            'name': device_name,
+            'address': device_address,
+            'rssi': getattr(service_info, 'rssi', -50),
+            'is_reachable': True,
+            'via_ha_bluetooth': True
+        }
+        # Annonce d'un appareil cloud encore non corrélé (PID ≈ adresse MAC) ?
+        pending_device = self._bluetooth_device_for_address(device_address)
+        is_pending = (
+            pending_device is not None
+            and pending_device['pid'] not in self._ble_address_by_pid
+        )
+        if device_address not in self._pid_by_ble_address:
+            self._correlate_ble_with_cloud_device_by_addr(device_address, device_name)
+
+        if self.next_ble_scan is None:
+            return
+        if self._ble_fully_correlated():
+            self._reset_ble_backoff()
+            return
+
+        # Seul un appareil attendu de retour à portée écourte le backoff : les
+        # motifs de nom larges ("pro", "mars") correspondent aussi à des appareils tiers
+        if not is_pending:
+            return
+        now = time.monotonic()
+        if (
+            self._last_early_ble_scan is not None
+            and now - self._last_early_ble_scan < BLE_EARLY_RESCAN_MIN.total_seconds()
+        ):
+            return
+        self._last_early_ble_scan = now
+        _LOGGER.info(f"MarsPro advertisement from {device_address}, re-scanning BLE early")
+        self._cancel_ble_rescan()
+        self._schedule_ble_scan(self._device_map)
+
+    async def async_stop_background_tasks(self):
+        """Arrêter l'énumération, le scan BLE et l'écoute des annonces"""
+        for task in (self._page_task, self._ble_scan_task):
+            if task is not None:
+                task.cancel()
+        self._page_task = self._ble_scan_task = None
+        if self._command_unsub is not None:
+            self._command_unsub()
+            self._command_unsub = None
+        self._cancel_ble_rescan()
+        if self._ble_unsubscribe is not None:
+            self._ble_unsubscribe()
+            self._ble_unsubscribe = None
+
+    def _publish_devices(self, device_map):
+        """Exposer la carte des appareils aux entités, avec le diff par appareil"""
+        previous = self._snapshot
+        changed = {
+            device_id for device_id, device in device_map.items()
+            if previous.get(device_id) != device
+        }
+        removed = previous.keys() - device_map.keys()
+
+        # Seules les entités des appareils modifiés écrivent leur état
+        self.changed_device_ids = changed | removed
+        self.last_diff = {
+            "changed": len(changed),
+            "unchanged": len(device_map) - len(changed),
+            "removed": len(removed),
+        }
+        self._snapshot = dict(device_map)
+
+        self._device_map = device_map
+        self.devices = list(device_map.values())
+        self._rebuild_indexes()
+        _LOGGER.info(
+            f"Found {len(self.devices)} devices via MarsPro API "
+            f"({self.last_diff['changed']} changed, {self.last_diff['unchanged']} unchanged)"
+        )
+        return {
+            "devices": self.devices,
+            "bluetooth_devices": self.bluetooth_devices
+        }
+
     async def _scan_bluetooth_devices(self):
         """Scanner les appareils Bluetooth BLE MarsPro avec patterns découverts."""
         try:
@@ -374,7 +800,7 @@ class MarsHydroDataUpdateCoordinator(DataUpdateCoordinator):
                                     'via_ha_bluetooth': True
                                 }
                                 
-                                await self._correlate_ble_with_cloud_device_by_addr(device_address, device_name)
+                                self._correlate_ble_with_cloud_device_by_addr(device_address, device_name)
                         
                         if self.bluetooth_devices:
                             _LOGGER.info(f"HA Bluetooth found {len(self.bluetooth_devices)} MarsPro devices")
@@ -410,23 +836,19 @@ class MarsHydroDataUpdateCoordinator(DataUpdateCoordinator):
                         _LOGGER.info(f"Found MarsPro BLE device: {device_name} ({device.address})")
                         
                         # Tenter de correlate avec les appareils cloud
-                        await self._correlate_ble_with_cloud_device(device)
+                        self._correlate_ble_with_cloud_device(device)
                 
                 if not self.bluetooth_devices:
                     _LOGGER.warning("No MarsPro BLE devices found with Bleak!")
                     _LOGGER.warning("Device may not be in pairing mode")
-                    self.ble_scan_failed = True
                 
             except ImportError:
                 _LOGGER.error("Bleak not available! Install: pip install bleak")
-                self.ble_scan_failed = True
             except Exception as bleak_error:
                 _LOGGER.error(f"Bleak scan failed: {bleak_error}")
-                self.ble_scan_failed = True
                 
         except Exception as e:
             _LOGGER.error(f"Bluetooth scan completely failed: {e}")
-            self.ble_scan_failed = True
 
     def _is_marspro_device_by_name_addr(self, device_name: str, device_address: str) -> bool:
         """Vérifier si un appareil est MarsPro par nom et adresse."""
@@ -442,53 +864,36 @@ class MarsHydroDataUpdateCoordinator(DataUpdateCoordinator):
                 return True
         
         # Vérifier correspondance PID dans adresse
-        for device in self.devices:
-            if device.get('is_bluetooth') and device.get('pid'):
-                pid = device['pid'].lower()
-                if pid in device_addr_clean:
-                    return True
-        
-        return False
+        return device_addr_clean in self._bluetooth_ids_by_pid
 
-    async def _correlate_ble_with_cloud_device_by_addr(self, ble_address: str, ble_name: str):
+    def _correlate_ble_with_cloud_device_by_addr(self, ble_address: str, ble_name: str):
         """Corréler par adresse et nom."""
-        ble_addr_clean = ble_address.replace(":", "").lower()
-        ble_name_lower = ble_name.lower()
+        # Pattern découvert: 34:5F:45:EC:73:CE ≈ 345F45EC73CC
+        cloud_device = self._bluetooth_device_for_address(ble_address)
+        if cloud_device is None and "dimbox" in ble_name.lower():
+            cloud_device = self._device_map.get(self._first_bluetooth_id)
         
-        for cloud_device in self.devices:
-            if cloud_device.get('is_bluetooth') and cloud_device.get('pid'):
-                cloud_pid = cloud_device['pid'].lower()
-                
-                # Pattern découvert: 34:5F:45:EC:73:CE ≈ 345F45EC73CC
-                if cloud_pid in ble_addr_clean or "dimbox" in ble_name_lower:
-                    _LOGGER.info(f"CORRELATED: BLE {ble_name} ({ble_address}) ↔ Cloud {cloud_device['name']}")
-                    cloud_device['ble_address'] = ble_address
-                    cloud_device['ble_name'] = ble_name
-                    return
-
-    async def _correlate_ble_with_cloud_device(self, ble_device):
+        if cloud_device is not None:
+            _LOGGER.info(f"CORRELATED: BLE {ble_name} ({ble_address}) ↔ Cloud {cloud_device['name']}")
+            self._link_ble_device(cloud_device, ble_address, ble_name)
+
+    def _correlate_ble_with_cloud_device(self, ble_device):
         """Corréler appareil BLE avec appareil cloud basé sur nos découvertes."""
-        ble_addr = ble_device.address.replace(":", "").lower()
-        ble_name = (ble_device.name or "").lower()
+        ble_name = ble_device.name or ""
         
-        # Pattern découvert: 34:5F:45:EC:73:CE ≈ 345F45EC73CC (PID)
-        for cloud_device in self.devices:
-            if cloud_device.get('is_bluetooth') and cloud_device.get('pid'):
-                cloud_pid = cloud_device['pid'].lower()
-                
-                # Méthode 1: Correspondance directe PID ↔ Adresse MAC
-                if cloud_pid in ble_addr or ble_addr.replace(":", "") in cloud_pid:
-                    _LOGGER.info(f"CORRELATED: BLE {ble_device.name} ↔ Cloud {cloud_device['name']}")
-                    cloud_device['ble_address'] = ble_device.address
-                    cloud_device['ble_device'] = ble_device
-                    return
-                
-                # Méthode 2: Pattern nom (MH-DIMBOX avec PID)
-                if "dimbox" in ble_name and cloud_pid in cloud_device['name'].lower():
-                    _LOGGER.info(f"CORRELATED by name: BLE {ble_device.name} ↔ Cloud {cloud_device['name']}")
-                    cloud_device['ble_address'] = ble_device.address
-                    cloud_device['ble_device'] = ble_device
-                    return
+        # Méthode 1: Correspondance directe PID ↔ Adresse MAC
+        cloud_device = self._bluetooth_device_for_address(ble_device.address)
+        if cloud_device is not None:
+            _LOGGER.info(f"CORRELATED: BLE {ble_device.name} ↔ Cloud {cloud_device['name']}")
+            self._link_ble_device(cloud_device, ble_device.address, ble_name, ble_device)
+            return
+        
+        # Méthode 2: Pattern nom (MH-DIMBOX avec PID)
+        if "dimbox" in ble_name.lower():
+            cloud_device = self._device_map.get(self._first_bluetooth_id)
+            if cloud_device is not None:
+                _LOGGER.info(f"CORRELATED by name: BLE {ble_device.name} ↔ Cloud {cloud_device['name']}")
+                self._link_ble_device(cloud_device, ble_device.address, ble_name, ble_device)
 
     def _is_marspro_device(self, device) -> bool:
         """Déterminer si un appareil BLE est un MarsPro avec patterns découverts."""
@@ -508,39 +913,31 @@ class MarsHydroDataUpdateCoordinator(DataUpdateCoordinator):
                 return True
         
         # Vérifier correspondance avec PIDs connus des appareils cloud
-        for processed_device in self.devices:
-            if processed_device.get('is_bluetooth') and processed_device.get('pid'):
-                cloud_pid = processed_device['pid'].lower()
-                
-                # Pattern découvert: 345F45EC73CC ≈ 34:5F:45:EC:73:CE
-                if cloud_pid in device_addr or any(
-                    cloud_pid[i:i+2] in device_addr for i in range(0, len(cloud_pid), 2)
-                ):
-                    _LOGGER.debug(f"MarsPro device detected by PID correlation: {device.name} ↔ {cloud_pid}")
-                    return True
+        # Pattern découvert: 345F45EC73CC ≈ 34:5F:45:EC:73:CE
+        if device_addr in self._bluetooth_ids_by_pid or any(
+            device_addr[i:i+2] in self._bluetooth_pid_chunks for i in range(len(device_addr) - 1)
+        ):
+            _LOGGER.debug(f"MarsPro device detected by PID correlation: {device.name}")
+            return True
         
         return False
 
     def get_devices_by_type(self, entity_type: str):
         """Récupérer les appareils par type d'entité."""
-        return [device for device in self.devices if device['entity_type'] == entity_type]
+        return [self._device_map[device_id] for device_id in self._ids_by_type.get(entity_type, ())]
 
     async def establish_ble_connection(self, device_pid: str):
         """Établir connexion BLE pour appareil hybride (MÉTHODE AMÉLIORÉE)."""
         try:
             # Trouver l'appareil correspondant
-            target_device = None
-            for device in self.devices:
-                if device.get('pid') == device_pid:
-                    target_device = device
-                    break
+            target_device = self.get_device_by_pid(device_pid)
             
             if not target_device:
                 _LOGGER.error(f"No device found for PID {device_pid}")
                 return None
             
             # Vérifier si on a une adresse BLE
-            ble_address = target_device.get('ble_address')
+            ble_address = self._ble_address_by_pid.get(device_pid)
             if not ble_address:
                 _LOGGER.warning(f"No BLE address found for PID {device_pid}")
                 _LOGGER.warning("Device may not be in pairing mode or not detected by BLE scan")
@@ -601,14 +998,9 @@ class MarsHydroDataUpdateCoordinator(DataUpdateCoordinator):
         """Libérer connexion BLE."""
         try:
             # Trouver l'adresse BLE
-            target_device = None
-            for device in self.devices:
-                if device.get('pid') == device_pid and device.get('ble_address'):
-                    target_device = device
-                    break
+            ble_address = self._ble_address_by_pid.get(device_pid)
             
-            if target_device:
-                ble_address = target_device['ble_address']
+            if ble_address:
                 if ble_address in self.ble_connections:
                     client = self.ble_connections[ble_address]
                     try:
@@ -653,21 +1045,60 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         email = entry.data["email"]
         password = entry.data["password"]
 
-        api = MarsProAPI(email, password)
+        store = Store(hass, STORAGE_VERSION, STORAGE_KEY.format(entry_id=entry.entry_id))
+        api = MarsProAPI(
+            email,
+            password,
+            store=store,
+            hedge_reads=entry.options.get(CONF_HEDGE_READS, False),
+        )
         
         try:
-            login_success = await api.login()
+            # Token persistant : éviter le login au redémarrage s'il est encore valide
+            login_success = await api.restore_token() or await api.login()
             if not login_success:
                 _LOGGER.error("Failed to login to MarsPro API")
+                await api.close()
                 return False
         except Exception as err:
             _LOGGER.error(f"Failed to connect to MarsPro API: {err}")
+            await api.close()
             return False
 
-        coordinator = MarsHydroDataUpdateCoordinator(hass, api)
+        api.start_token_refresh()
+
+        # Options modifiées (bornes de polling...) : recharger l'entrée
+        entry.async_on_unload(entry.add_update_listener(async_reload_entry))
+
+        # Profil du compte (userId, fuseau...) : relu du stockage s'il est encore frais
+        await api.get_profile()
+
+        # Backend legacy connecté en arrière-plan : un basculement ne paie pas de login
+        api.start_legacy_warmup()
+
+        coordinator = MarsHydroDataUpdateCoordinator(
+            hass,
+            api,
+            min_interval=timedelta(
+                seconds=entry.options.get(
+                    CONF_MIN_POLL_INTERVAL, DEFAULT_MIN_POLL_INTERVAL.total_seconds()
+                )
+            ),
+            max_interval=timedelta(
+                seconds=entry.options.get(
+                    CONF_MAX_POLL_INTERVAL, DEFAULT_MAX_POLL_INTERVAL.total_seconds()
+                )
+            ),
+        )
+        coordinator.async_start_ble_discovery()
 
         # Fetch initial data so we have data when entities subscribe
-        await coordinator.async_config_entry_first_refresh()
+        try:
+            await coordinator.async_config_entry_first_refresh()
+        except Exception:
+            await coordinator.async_stop_background_tasks()
+            await api.close()
+            raise
 
         hass.data.setdefault(DOMAIN, {})
         hass.data[DOMAIN][entry.entry_id] = coordinator
@@ -678,6 +1109,11 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         return True
 
 
+async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Reload the config entry when its options change."""
+    await hass.config_entries.async_reload(entry.entry_id)
+
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     coordinator = hass.data[DOMAIN][entry.entry_id]
@@ -695,4 +1131,16 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     if unload_ok:
         hass.data[DOMAIN].pop(entry.entry_id)
 
+        # Arrêter les tâches de fond puis fermer la session HTTP de l'API cloud
+        if hasattr(coordinator, 'async_stop_background_tasks'):
+            await coordinator.async_stop_background_tasks()
+        if hasattr(coordinator, 'api'):
+            await coordinator.api.close()
+
     return unload_ok
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Remove persisted data (token) when a config entry is deleted."""
+    store = Store(hass, STORAGE_VERSION, STORAGE_KEY.format(entry_id=entry.entry_id))
+    await store.async_remove()
@@ -4,11 +4,13 @@ import time
 import logging
 import asyncio
 
+from .transport import RequestScheduler, SingleFlight, interactive_command
+
 _LOGGER = logging.getLogger(__name__)
 
 
 class MarsHydroAPI:
-    def __init__(self, email, password):
+    def __init__(self, email, password, scheduler=None, session=None):
         self.email = email
         self.password = password
         self.token = None
@@ -17,6 +19,27 @@ class MarsHydroAPI:
         self.last_login_time = 0
         self.login_interval = 300  # Minimum interval between logins in seconds
         self.device_id = None  # Added device_id attribute to store dynamically
+        self._single_flight = SingleFlight()  # Share concurrent device list fetches
+        # Bounded per-account concurrency, may be shared with the MarsPro client
+        self.scheduler = scheduler or RequestScheduler()
+        # Long-lived pooled HTTP session, owned unless provided by the caller
+        self._session = session
+        self._owns_session = session is None
+
+    def _get_session(self):
+        """Return the shared HTTP session, creating it on first use."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=4, ttl_dns_cache=300)
+            )
+            self._owns_session = True
+        return self._session
+
+    async def close(self):
+        """Close the HTTP session if this client owns it."""
+        if self._session is not None and self._owns_session and not self._session.closed:
+            await self._session.close()
+        self._session = None
 
     async def login(self):
         """Authenticate and retrieve the token."""
@@ -34,7 +57,8 @@ class MarsHydroAPI:
                 "loginMethod": "1",
             }
 
-            async with aiohttp.ClientSession() as session:
+            async with self.scheduler.write_slot():
+                session = self._get_session()
                 async with session.post(
                     f"{self.base_url}/ulogin/mailLogin/v1",
                     headers=headers,
@@ -42,21 +66,22 @@ class MarsHydroAPI:
                 ) as response:
                     response.raise_for_status()
                     data = await response.json()
-                    _LOGGER.info("API Login Response: %s", json.dumps(data, indent=2))
+                    if _LOGGER.isEnabledFor(logging.DEBUG):
+                        _LOGGER.debug("API Login Response: %s", json.dumps(data, indent=2))
                     self.token = data["data"]["token"]
                     self.last_login_time = now
                     _LOGGER.info("Login erfolgreich, Token erhalten.")
 
     async def safe_api_call(self, func, *args, **kwargs):
-        """Ensure thread-safe API calls."""
-        async with self.api_lock:
-            return await func(*args, **kwargs)
+        """Call the API; concurrency is bounded per request by the scheduler."""
+        return await func(*args, **kwargs)
 
     async def _ensure_token(self):
         """Ensure that the token is valid."""
         if not self.token:
             await self.login()
 
+    @interactive_command
     async def toggle_switch(self, is_close: bool, device_id: str):
         """Toggle the light or fan switch (on/off)."""
         await self._ensure_token()
@@ -72,26 +97,52 @@ class MarsHydroAPI:
             "groupId": None,
         }
 
-        _LOGGER.debug(f"Sending toggle switch payload: {json.dumps(payload, indent=2)}")
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug(f"Sending toggle switch payload: {json.dumps(payload, indent=2)}")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.scheduler.device_lock(device_id), self.scheduler.write_slot():
+            session = self._get_session()
             async with session.post(
                 f"{self.base_url}/udm/lampSwitch/v1", headers=headers, json=payload
             ) as response:
                 response_json = await response.json()
-                _LOGGER.info(
-                    "API Toggle Switch Response: %s",
-                    json.dumps(response_json, indent=2),
-                )
-                if response_json.get("code") == "102":  # Handle token expiration
-                    _LOGGER.warning("Token expired, re-authenticating...")
-                    await self.login()
-                    return await self.toggle_switch(is_close, device_id)
-                return response_json
+                if _LOGGER.isEnabledFor(logging.DEBUG):
+                    _LOGGER.debug(
+                        "API Toggle Switch Response: %s",
+                        json.dumps(response_json, indent=2),
+                    )
 
+        if response_json.get("code") == "102":  # Handle token expiration
+            _LOGGER.warning("Token expired, re-authenticating...")
+            await self.login()
+            return await self.toggle_switch(is_close, device_id)
+        return response_json
+
+
+    @property
+    def request_stats(self):
+        """Return request coalescing counters."""
+        return self._single_flight.stats
 
     async def _process_device_list(self, product_type):
-        """Retrieve device list for a given product type."""
+        """Retrieve device list for a given product type, sharing in-flight calls."""
+        return await self._single_flight.run(
+            ("getDeviceList", product_type), self._fetch_device_list, product_type
+        )
+
+    async def _fetch_device_list(self, product_type):
+        """Fetch the device list for a given product type, following all pages."""
+        device_list = []
+        page = 0
+        while True:
+            page_list, total = await self._fetch_device_page(product_type, page)
+            device_list.extend(page_list)
+            if not page_list or not total or len(device_list) >= total:
+                return device_list
+            page += 1
+
+    async def _fetch_device_page(self, product_type, page):
+        """Fetch one page of the device list, returning (devices, total)."""
         await self._ensure_token()
         system_data = self._generate_system_data()
         headers = {
@@ -101,19 +152,20 @@ class MarsHydroAPI:
             "User-Agent": "Python/3.x",
             "systemData": system_data,
         }
-        payload = {"currentPage": 0, "type": None, "productType": product_type}
+        payload = {"currentPage": page, "type": None, "productType": product_type}
 
-        async with aiohttp.ClientSession() as session:
+        async with self.scheduler.read_slot():
+            session = self._get_session()
             async with session.post(
                 f"{self.base_url}/udm/getDeviceList/v1", headers=headers, json=payload
             ) as response:
                 response_json = await response.json()
                 if response_json.get("code") == "000":
-                    device_list = response_json.get("data", {}).get("list", [])
-                    return device_list
+                    data = response_json.get("data") or {}
+                    return data.get("list", []), data.get("total")
                 else:
                     _LOGGER.error("Error in API response: %s", response_json.get("msg"))
-                    return []
+                    return [], None
 
     async def get_lightdata(self):
         """Retrieve light data from the Mars Hydro API."""
@@ -137,7 +189,8 @@ class MarsHydroAPI:
         device_list = await self._process_device_list("WIND")
         if device_list:
             device_data = device_list[0]
-            _LOGGER.debug("Fan data retrieved: %s", json.dumps(device_data, indent=2))
+            if _LOGGER.isEnabledFor(logging.DEBUG):
+                _LOGGER.debug("Fan data retrieved: %s", json.dumps(device_data, indent=2))
             return {
                 "deviceName": device_data.get("deviceName"),
                 "deviceLightRate": device_data.get("deviceLightRate"),
@@ -152,6 +205,7 @@ class MarsHydroAPI:
             _LOGGER.warning("No fan devices found.")
             return None
 
+    @interactive_command
     async def set_brightness(self, brightness):
         """Set the brightness of the Mars Hydro light."""
         await self._ensure_token()
@@ -175,17 +229,20 @@ class MarsHydroAPI:
             "groupId": None,
         }
 
-        async with aiohttp.ClientSession() as session:
+        async with self.scheduler.device_lock(self.device_id), self.scheduler.write_slot():
+            session = self._get_session()
             async with session.post(
                 f"{self.base_url}/udm/adjustLight/v1", headers=headers, json=payload
             ) as response:
                 response_json = await response.json()
-                _LOGGER.info(
-                    "API Set Brightness Response: %s",
-                    json.dumps(response_json, indent=2),
-                )
+                if _LOGGER.isEnabledFor(logging.DEBUG):
+                    _LOGGER.debug(
+                        "API Set Brightness Response: %s",
+                        json.dumps(response_json, indent=2),
+                    )
                 return response_json
 
+    @interactive_command
     async def set_fanspeed(self, speed, fan_device_id):
         """Set the speed of the Mars Hydro fan."""
         await self._ensure_token()
@@ -204,17 +261,20 @@ class MarsHydroAPI:
             "groupId": None,
         }
 
-        _LOGGER.debug(f"Sending fan speed payload: {json.dumps(payload, indent=2)}")
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug(f"Sending fan speed payload: {json.dumps(payload, indent=2)}")
 
-        async with aiohttp.ClientSession() as session:
+        async with self.scheduler.device_lock(fan_device_id), self.scheduler.write_slot():
+            session = self._get_session()
             async with session.post(
                 f"{self.base_url}/udm/adjustLight/v1", headers=headers, json=payload
             ) as response:
                 response_json = await response.json()
-                _LOGGER.info(
-                    "API Set Fan Speed Response: %s",
-                    json.dumps(response_json, indent=2),
-                )
+                if _LOGGER.isEnabledFor(logging.DEBUG):
+                    _LOGGER.debug(
+                        "API Set Fan Speed Response: %s",
+                        json.dumps(response_json, indent=2),
+                    )
                 return response_json
 
     def _generate_system_data(self):
@@ -3,9 +3,28 @@ import json
 import time
 import logging
 import asyncio
+import itertools
+import math
 import random
 import re
 
+from .api import MarsHydroAPI
+from .transport import (
+    CircuitBreaker,
+    LatencyTracker,
+    LatestValueCoalescer,
+    RequestScheduler,
+    SingleFlight,
+    SystemDataTemplate,
+    TTLCache,
+    create_background_task,
+    interactive_command,
+    is_background_request,
+    json_dumps,
+    json_loads,
+    request_key,
+)
+
 # Support Bluetooth BLE pour appareils MarsPro Bluetooth
 try:
     from bleak import BleakScanner, BleakClient
@@ -15,14 +34,153 @@ except ImportError:
 
 _LOGGER = logging.getLogger(__name__)
 
+# Pool de connexions HTTP (keep-alive + cache DNS) partagé par toutes les requêtes
+DEFAULT_CONNECTOR_LIMIT = 10
+DEFAULT_CONNECTOR_LIMIT_PER_HOST = 4
+DEFAULT_DNS_CACHE_TTL = 300  # secondes
+DEFAULT_KEEPALIVE_TIMEOUT = 60  # secondes
+
+# Cache des réponses de lecture : TTL par endpoint et nombre maximal d'entrées
+DEFAULT_CACHE_TTLS = {
+    "/api/android/udm/getDeviceList/v1": 10,
+}
+DEFAULT_CACHE_SIZE = 128
+
+# Détail d'un appareil (getDeviceDetail) : cache dédié, par ID d'appareil
+DEFAULT_DETAIL_TTL = 10  # secondes
+
+# Champs statiques de l'en-tête systemdata, exacts des captures de l'app MarsPro
+SYSTEMDATA_STATIC = {
+    "appVersion": "1.3.2",  # Version exacte de l'app
+    "osType": "android",
+    "osVersion": "15",      # Version exacte capturée
+    "deviceType": "SM-S928B",  # Type exact capturé
+    "deviceId": "AP3A.240905.015.A2",  # ID exact capturé
+    "netType": "wifi",
+    "wifiName": "unknown",  # Valeur exacte capturée
+}
+
+# Profil du compte (mine/info) : source unique de userId, fuseau, langue...
+DEFAULT_PROFILE_TTL = 7 * 24 * 3600  # secondes, persisté dans .storage
+PROFILE_DEFAULTS = {
+    "timezone": "34",  # Valeurs exactes des captures, si le profil ne les donne pas
+    "language": "French",
+}
+
+# Durée de vie du token et renouvellement anticipé (avant expiration)
+DEFAULT_TOKEN_LIFETIME = 24 * 3600  # secondes
+DEFAULT_TOKEN_REFRESH_MARGIN = 3600  # secondes
+TOKEN_REFRESH_RETRY_DELAY = 60  # secondes
+TOKEN_EXPIRED_CODES = ("102",)  # Code "token expiré" (cf. MarsHydroAPI.toggle_switch)
+
+# Fenêtre de debounce des commandes luminosité / vitesse (la dernière valeur gagne)
+DEFAULT_COMMAND_DEBOUNCE = 0.25  # secondes
+
+# Requêtes simultanées maximum pour le compte (un créneau réservé aux écritures)
+DEFAULT_MAX_CONCURRENCY = 4
+
+# Politique de transport : délais par endpoint, retries des lectures, disjoncteur
+DEFAULT_REQUEST_TIMEOUT = 30  # secondes
+DEFAULT_REQUEST_TIMEOUTS = {
+    "/api/android/ulogin/mailLogin/v1": 15,
+    "/api/android/udm/getDeviceList/v1": 15,
+    "/api/android/udm/getDeviceDetail/v1": 10,
+    "/api/android/mine/info/v1": 10,
+    "/api/upData/device": 10,
+}
+DEFAULT_MAX_RETRIES = 2  # Lectures idempotentes uniquement
+RETRY_BACKOFF_BASE = 0.5  # secondes
+RETRY_BACKOFF_MAX = 8  # secondes
+RETRYABLE_HTTP_STATUSES = (429, 500, 502, 503, 504)
+DEFAULT_BREAKER_THRESHOLD = 5
+# Délais dérivés des latences observées (plafonnés par request_timeouts)
+LATENCY_MIN_SAMPLES = 10
+DEADLINE_P99_FACTOR = 3
+DEADLINE_FLOOR = 2  # secondes
+DEFAULT_BREAKER_RESET = 60  # secondes
+
+# Activation cloud (setDeviceActiveV) : état collant, mémorisé par appareil
+DEFAULT_ACTIVATION_TTL = 3600  # secondes
+ACTIVATION_SETTLE_DELAY = 1  # secondes, après une activation réelle uniquement
+
+# Appareils Bluetooth : considérés éveillés après une interaction réussie récente
+DEFAULT_WAKEUP_THRESHOLD = 60  # secondes
+
+# Énumération paginée des appareils : pages suivantes récupérées en parallèle
+DEFAULT_PAGE_CONCURRENCY = 3
+
+# Découverte sur tous les groupes de produits (l'appareil des captures est dans
+# le groupe 1) ; un groupe vide n'est ré-interrogé qu'après EMPTY_GROUP_TTL
+DEFAULT_PRODUCT_GROUPS = (1, 2, 3)
+EMPTY_GROUP_TTL = 3600  # secondes
+
+# Formats de contrôle alternatifs (dernière chance de la cascade hybride)
+ALTERNATIVE_CONTROL_FORMATS = ("alt_upDataStatus", "alt_deviceControl", "alt_lightControl")
+# Chemins qui ne transmettent pas la luminosité (marche / arrêt seulement)
+PWM_LESS_CONTROL_METHODS = ("legacy_toggle",)
+
+# Backend legacy (MarsHydroAPI) gardé chaud en secours : vérification périodique
+DEFAULT_LEGACY_HEALTH_INTERVAL = 300  # secondes
+
+# Lecture couverte (hedging) entre MarsPro et legacy : le second backend part si
+# le premier n'a pas répondu dans le percentile de latence observé
+DEFAULT_HEDGE_PERCENTILE = 95
+DEFAULT_HEDGE_DELAY = 2.0  # secondes, tant qu'il y a trop peu de mesures
+HEDGE_MIN_SAMPLES = 5
+BACKEND_SWITCH_WINS = 3  # Victoires consécutives avant d'inverser l'ordre
+READ_BACKENDS = ("marspro", "legacy")
+
 
 class MarsProAPI:
-    def __init__(self, email, password):
+    def __init__(
+        self,
+        email,
+        password,
+        session=None,
+        connector_limit=DEFAULT_CONNECTOR_LIMIT,
+        connector_limit_per_host=DEFAULT_CONNECTOR_LIMIT_PER_HOST,
+        dns_cache_ttl=DEFAULT_DNS_CACHE_TTL,
+        keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT,
+        cache_ttls=None,
+        cache_size=DEFAULT_CACHE_SIZE,
+        detail_ttl=DEFAULT_DETAIL_TTL,
+        profile_ttl=DEFAULT_PROFILE_TTL,
+        store=None,
+        token_lifetime=DEFAULT_TOKEN_LIFETIME,
+        token_refresh_margin=DEFAULT_TOKEN_REFRESH_MARGIN,
+        command_debounce=DEFAULT_COMMAND_DEBOUNCE,
+        max_concurrency=DEFAULT_MAX_CONCURRENCY,
+        scheduler=None,
+        request_timeouts=None,
+        max_retries=DEFAULT_MAX_RETRIES,
+        breaker_threshold=DEFAULT_BREAKER_THRESHOLD,
+        breaker_reset=DEFAULT_BREAKER_RESET,
+        hedge_requests=True,
+        activation_ttl=DEFAULT_ACTIVATION_TTL,
+        wakeup_threshold=DEFAULT_WAKEUP_THRESHOLD,
+        legacy_health_interval=DEFAULT_LEGACY_HEALTH_INTERVAL,
+        hedge_reads=False,
+        hedge_percentile=DEFAULT_HEDGE_PERCENTILE,
+        page_concurrency=DEFAULT_PAGE_CONCURRENCY,
+        product_groups=DEFAULT_PRODUCT_GROUPS,
+    ):
         self.email = email
         self.password = password
         self.token = None
-        self.user_id = None
+
+        # Profil du compte mis en cache (mémoire + .storage)
+        self.profile = {}
+        self.profile_ttl = profile_ttl
+        self._profile_fetched_at = 0
         self.base_url = "https://mars-pro.api.lgledsolutions.com"  # URL CORRECTE !
+
+        # Session HTTP longue durée : fournie par Home Assistant ou créée à la demande
+        self._session = session
+        self._owns_session = session is None
+        self.connector_limit = connector_limit
+        self.connector_limit_per_host = connector_limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
         
         # Bluetooth BLE support
         self.bluetooth_support = BLUETOOTH_SUPPORT
@@ -39,58 +197,374 @@ class MarsProAPI:
             "mine_info": "/api/android/mine/info/v1",  # ENDPOINT CONFIRMÉ !
             "device_control": "/api/upData/device"  # ENDPOINT RÉEL CAPTURÉ !
         }
-        self.api_lock = asyncio.Lock()
+        self.read_endpoints = {
+            self.endpoints["device_list"],
+            self.endpoints["device_detail"],
+            self.endpoints["mine_info"],
+        }
+
+        # Concurrence bornée par compte, écritures sérialisées par appareil
+        self.scheduler = scheduler or RequestScheduler(max_concurrency)
+
+        # Retries avec backoff exponentiel + jitter, délais par endpoint, disjoncteur
+        self.request_timeouts = dict(
+            DEFAULT_REQUEST_TIMEOUTS if request_timeouts is None else request_timeouts
+        )
+        self.max_retries = max_retries
+        self.circuit_breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+
+        # Latences p50/p95/p99 par endpoint ; lecture doublée au-delà du p95
+        self.endpoint_latency = LatencyTracker()
+        self.hedge_requests = hedge_requests
+        self.hedged_requests = 0
+        self.hedge_wins = 0
         self.last_login_time = 0
         self.login_interval = 300  # Minimum interval between logins in seconds
         self.device_id = None
 
+        # En-tête systemdata pré-sérialisé ; reqId incrémental (départ aléatoire)
+        self._systemdata_template = None
+        self._req_ids = itertools.count(random.randint(10000000000, 89999999999))
+
+        # Identifiants de message incrémentaux pour les trames de commande
+        self._msg_ids = itertools.count(1)
+        self.last_command_results = []
+
+        # Commandes par (appareil, attribut) : seule la valeur la plus récente est envoyée
+        self._command_coalescer = LatestValueCoalescer(command_debounce)
+
+        # Requêtes de lecture identiques et concurrentes partagées (single-flight)
+        self._single_flight = SingleFlight()
+
+        # Cache LRU des réponses de lecture, invalidé après chaque commande réussie
+        self.cache_ttls = dict(DEFAULT_CACHE_TTLS if cache_ttls is None else cache_ttls)
+        self._response_cache = TTLCache(cache_size)
+        self._cache_generation = 0
+        self.polls_dropped = 0
+
+        # Cache des détails par appareil, pour les rafraîchissements ciblés
+        self.detail_ttl = detail_ttl
+        self._detail_cache = TTLCache(cache_size)
+
+        # Token persistant (.storage de Home Assistant) et renouvellement en arrière-plan
+        self._store = store
+        self._stored = {}
+        self.token_lifetime = token_lifetime
+        self.token_refresh_margin = token_refresh_margin
+        self._login_lock = asyncio.Lock()
+        self._token_refresh_task = None
+
+        # Chemin de contrôle appris par PID puis par type de commande (persisté)
+        # pour control_device_hybrid : {pid: {"power" | "brightness": stratégie}}
+        self.control_strategies = {}
+        self.last_ble_strategy = None
+
+        # Activation cloud mémorisée par PID : ne ré-activer qu'à expiration ou sur refus
+        self.activation_ttl = activation_ttl
+        self._activated_at = {}
+        self.activations_skipped = 0
+
+        # Fenêtre d'éveil des appareils Bluetooth (dernière interaction réussie par PID).
+        # "Réussie" = acceptée par le relais cloud (upData code 000) : l'API
+        # n'expose aucun état d'éveil de l'appareil lui-même
+        self.wakeup_threshold = wakeup_threshold
+        self._last_awake = {}
+        self.wakeups_skipped = 0
+
+        # Backend legacy de secours : instancié une seule fois, avec son propre token
+        self.legacy_api = None
+        self.legacy_base_url = None
+        self.legacy_healthy = None
+        self.legacy_health_interval = legacy_health_interval
+        self._legacy_lock = asyncio.Lock()
+        self._legacy_health_task = None
+        self._legacy_warmup_task = None
+
+        # Lectures couvertes : latence par backend et ordre adapté au gagnant
+        self.hedge_reads = hedge_reads
+        self.hedge_percentile = hedge_percentile
+        self.backend_latency = LatencyTracker()
+        self.preferred_read_backend = READ_BACKENDS[0]
+        self.read_backend_wins = dict.fromkeys(READ_BACKENDS, 0)
+        self._win_streak = (None, 0)
+        self._hedge_tasks = set()
+
+        # Pages de la liste d'appareils téléchargées simultanément (borne)
+        self.page_concurrency = page_concurrency
+
+        # Groupes de produits interrogés en parallèle, groupes vides mémorisés
+        self.product_groups = tuple(product_groups)
+        self._empty_groups = {}
+
+        # PID par ID cloud (liste / détail) et abonnés aux commandes réussies
+        self._device_pids = {}
+        self._command_listeners = []
+
+    def _get_session(self):
+        """Retourner la session HTTP partagée, créée à la demande avec un pool keep-alive"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.connector_limit,
+                limit_per_host=self.connector_limit_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._owns_session = True
+        return self._session
+
+    async def close(self):
+        """Arrêter les tâches de fond et fermer la session HTTP si elle appartient à l'API"""
+        if self._token_refresh_task is not None:
+            self._token_refresh_task.cancel()
+            self._token_refresh_task = None
+        self._command_coalescer.cancel()
+        for task in self._hedge_tasks:
+            task.cancel()
+        self._hedge_tasks.clear()
+        for task in (self._legacy_warmup_task, self._legacy_health_task):
+            if task is not None:
+                task.cancel()
+        self._legacy_warmup_task = self._legacy_health_task = None
+        if self.legacy_api is not None:
+            await self.legacy_api.close()
+            self.legacy_api = None
+        if self._session is not None and self._owns_session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
     async def _make_request(self, endpoint, payload):
-        """Faire une requête avec les vrais paramètres capturés"""
+        """Faire une requête ; sur token expiré, se reconnecter puis rejouer une fois"""
+        token = self.token
+        data = await self._post(endpoint, payload)
+
+        if (
+            data
+            and data.get('code') in TOKEN_EXPIRED_CODES
+            and endpoint != self.endpoints["login"]
+        ):
+            _LOGGER.warning("MarsPro token expired, re-authenticating...")
+            try:
+                await self._relogin(token)
+            except Exception as e:
+                _LOGGER.error(f"MarsPro re-authentication failed: {e}")
+                return data
+            return await self._post(endpoint, payload)
+
+        return data
+
+    async def _post(self, endpoint, payload):
+        """Envoyer une requête selon la politique de transport.
+
+        Les lectures idempotentes sont retentées avec backoff exponentiel et
+        jitter ; tant que le disjoncteur est ouvert, on échoue immédiatement.
+        """
+        attempts = 1 + (self.max_retries if endpoint in self.read_endpoints else 0)
+
+        for attempt in range(attempts):
+            if not self.circuit_breaker.allow_request():
+                _LOGGER.debug(f"MarsPro circuit open, failing fast: {endpoint}")
+                return None
+
+            if attempt:
+                delay = self._backoff_delay(attempt)
+                _LOGGER.debug(f"MarsPro retry {attempt}/{self.max_retries} for {endpoint} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+            if self.hedge_requests and endpoint in self.read_endpoints:
+                data, retryable = await self._post_hedged(endpoint, payload)
+            else:
+                data, retryable = await self._post_once(endpoint, payload)
+            if not retryable:
+                return data
+
+        return None
+
+    @staticmethod
+    def _backoff_delay(attempt):
+        """Backoff exponentiel plafonné avec jitter complet"""
+        return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** attempt))
+
+    def _request_deadline(self, endpoint):
+        """Délai de la requête : issu du p99 observé, plafonné par la configuration"""
+        configured = self.request_timeouts.get(endpoint, DEFAULT_REQUEST_TIMEOUT)
+        if self.endpoint_latency.count(endpoint) < LATENCY_MIN_SAMPLES:
+            return configured
+        p99 = self.endpoint_latency.percentile(endpoint, 99)
+        return min(configured, max(DEADLINE_FLOOR, p99 * DEADLINE_P99_FACTOR))
+
+    async def _post_hedged(self, endpoint, payload):
+        """Lecture idempotente doublée si la première dépasse le p95 de l'endpoint.
+
+        Le délai ne court qu'une fois le créneau de l'ordonnanceur obtenu : le p95
+        ne mesure que l'échange réseau, pas l'attente en file. La première réponse
+        exploitable l'emporte, l'autre requête est annulée.
+        """
+        sent = asyncio.Event()
+        first = asyncio.ensure_future(self._post_once(endpoint, payload, sent))
+        if self.endpoint_latency.count(endpoint) < LATENCY_MIN_SAMPLES:
+            return await first
+
+        pending = {first}
+        try:
+            slot_acquired = asyncio.ensure_future(sent.wait())
+            try:
+                await asyncio.wait({first, slot_acquired}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                slot_acquired.cancel()
+
+            hedge_after = self.endpoint_latency.percentile(endpoint, 95)
+            done, _ = await asyncio.wait({first}, timeout=hedge_after)
+            if done:
+                return first.result()
+
+            _LOGGER.debug(f"MarsPro {endpoint} slower than p95 ({hedge_after:.2f}s), hedging")
+            self.hedged_requests += 1
+            second = asyncio.ensure_future(self._post_once(endpoint, payload))
+            pending = {first, second}
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if not result[1]:
+                        if task is second:
+                            self.hedge_wins += 1
+                        return result
+                if not pending:
+                    return result
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _post_once(self, endpoint, payload, sent=None):
+        """Faire une requête avec les vrais paramètres capturés.
+
+        Retourne (données, retryable) : retryable indique un échec de transport.
+        sent (asyncio.Event), si fourni, est positionné dès l'obtention du créneau.
+        """
         url = f"{self.base_url}{endpoint}"
         
         # Headers exacts capturés de l'app MarsPro RÉELLE !
-        systemdata = {
-            "reqId": str(random.randint(10000000000, 99999999999)),
-            "appVersion": "1.3.2",  # Version exacte de l'app
-            "osType": "android",
-            "osVersion": "15",      # Version exacte capturée
-            "deviceType": "SM-S928B",  # Type exact capturé
-            "deviceId": "AP3A.240905.015.A2",  # ID exact capturé
-            "netType": "wifi",
-            "wifiName": "unknown",  # Valeur exacte capturée
-            "timestamp": str(int(time.time())),
-            "timezone": "34",       # Timezone exacte capturée
-            "language": "French"
-        }
-        
-        # Ajouter le token si disponible
-        if self.token:
-            systemdata["token"] = self.token
-        
         headers = {
             'Content-Type': 'application/json',
             'User-Agent': 'Dart/3.4 (dart:io)',  # User-Agent exact capturé
-            'systemdata': json.dumps(systemdata)
+            'systemdata': self._systemdata_header(),
         }
+        body = json_dumps(payload)
         
-        _LOGGER.debug(f"MarsPro request to {url}")
-        _LOGGER.debug(f"Headers: {headers}")
-        _LOGGER.debug(f"Payload: {payload}")
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug(f"MarsPro request to {url}")
+            _LOGGER.debug(f"Headers: {headers}")
+            _LOGGER.debug(f"Payload: {body}")
         
+        if endpoint in self.read_endpoints:
+            slot = self.scheduler.read_slot()
+        else:
+            slot = self.scheduler.write_slot()
+
+        timeout = aiohttp.ClientTimeout(total=self._request_deadline(endpoint))
+
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=payload, headers=headers, timeout=30) as response:
+            session = self._get_session()
+            async with slot:
+                if sent is not None:
+                    sent.set()
+                started = time.monotonic()
+                async with session.post(url, data=body, headers=headers, timeout=timeout) as response:
                     if response.status == 200:
-                        data = await response.json()
-                        _LOGGER.debug(f"MarsPro response: {data}")
-                        return data
-                    else:
-                        _LOGGER.error(f"MarsPro HTTP error: {response.status}")
-                        return None
-                        
+                        data = await response.json(loads=json_loads)
+                        self.endpoint_latency.record(endpoint, time.monotonic() - started)
+                        self.circuit_breaker.record_success()
+                        if _LOGGER.isEnabledFor(logging.DEBUG):
+                            _LOGGER.debug(f"MarsPro response: {data}")
+                        return data, False
+
+                    _LOGGER.error(f"MarsPro HTTP error: {response.status}")
+                    if response.status in RETRYABLE_HTTP_STATUSES:
+                        self.circuit_breaker.record_failure()
+                        return None, True
+                    self.circuit_breaker.record_success()
+                    return None, False
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            _LOGGER.error(f"MarsPro request failed: {e!r}")
+            self.circuit_breaker.record_failure()
+            return None, True
         except Exception as e:
             _LOGGER.error(f"MarsPro request failed: {e}")
-            return None
+            return None, False
+
+    def _systemdata_header(self):
+        """En-tête systemdata : gabarit pré-sérialisé, reconstruit si le profil change"""
+        profile_fields = {
+            "timezone": self._profile_value("timezone"),
+            "language": self._profile_value("language"),
+        }
+        template = self._systemdata_template
+        if template is None or any(
+            template.static_fields[key] != value for key, value in profile_fields.items()
+        ):
+            template = SystemDataTemplate({**SYSTEMDATA_STATIC, **profile_fields})
+            self._systemdata_template = template
+        return template.render(next(self._req_ids), self.token)
+
+    async def _make_read_request(self, endpoint, payload):
+        """Requête de lecture servie par le cache, sinon partagée entre appelants concurrents"""
+        key = request_key(endpoint, payload)
+        ttl = self.cache_ttls.get(endpoint)
+
+        if ttl:
+            cached = self._response_cache.get(key)
+            if cached is not None:
+                _LOGGER.debug(f"MarsPro cache hit: {endpoint}")
+                return cached
+
+            # Polling pendant des commandes utilisateur : servir la dernière réponse connue
+            if is_background_request() and self.scheduler.interactive_pending:
+                stale = self._response_cache.get_stale(key)
+                if stale is not None:
+                    self.polls_dropped += 1
+                    _LOGGER.debug(f"MarsPro poll dropped while commands are pending: {endpoint}")
+                    return stale
+
+        generation = self._cache_generation
+        data = await self._single_flight.run(key, self._make_request, endpoint, payload)
+
+        # Ne pas mettre en cache une lecture partie avant une commande entre-temps réussie
+        if ttl and data and data.get('code') == '000' and generation == self._cache_generation:
+            self._response_cache.set(key, data, ttl)
+        return data
+
+    def invalidate_cache(self, endpoint=None):
+        """Oublier les réponses en cache (après une commande qui modifie l'état)"""
+        self._cache_generation += 1
+        self._response_cache.invalidate(endpoint)
+        if endpoint in (None, self.endpoints["device_detail"]):
+            self._detail_cache.invalidate()
+
+    @property
+    def request_stats(self):
+        """Statistiques de coalescence et de cache des requêtes de lecture"""
+        return {
+            **self._single_flight.stats,
+            "cache": self._response_cache.stats,
+            "detail_cache": self._detail_cache.stats,
+            "commands": self._command_coalescer.stats,
+            "scheduler": self.scheduler.stats,
+            "polls_dropped": self.polls_dropped,
+            "circuit": self.circuit_breaker.stats,
+            "latency": self.endpoint_latency.stats,
+            "hedged": {"sent": self.hedged_requests, "won": self.hedge_wins},
+            "activations_skipped": self.activations_skipped,
+            "wakeups_skipped": self.wakeups_skipped,
+            "legacy_healthy": self.legacy_healthy,
+            "empty_product_groups": sorted(self._empty_groups),
+            "read_backends": {
+                "preferred": self.preferred_read_backend,
+                "wins": dict(self.read_backend_wins),
+                "latency": self.backend_latency.stats,
+            },
+        }
 
     async def login(self):
         """Connexion avec les vrais paramètres découverts"""
@@ -107,69 +581,226 @@ class MarsProAPI:
         
         if data and data.get('code') == '000':  # Code de succès MarsPro
             self.token = data['data']['token']
-            self.user_id = data['data']['userId']
+            self.profile["userId"] = data['data']['userId']
+            self.last_login_time = time.time()
             _LOGGER.info("MarsPro authentication successful!")
+            await self._save_token()
             return True
         else:
             error_msg = data.get('msg', 'Unknown error') if data else "No response"
             _LOGGER.error(f"MarsPro authentication failed: {error_msg}")
             raise Exception(f"MarsPro authentication failed: {error_msg}")
 
-    async def _fallback_to_legacy_api(self):
-        """Fallback to legacy MarsHydro API if MarsPro fails."""
+    @property
+    def user_id(self):
+        """Identifiant du compte, issu du profil"""
+        return self.profile.get("userId")
+
+    def _profile_value(self, key):
+        """Champ du profil du compte, ou valeur capturée par défaut"""
+        value = self.profile.get(key)
+        return PROFILE_DEFAULTS.get(key) if value in (None, "") else value
+
+    async def get_profile(self, force=False):
+        """Profil du compte (mine/info), récupéré une fois puis mis en cache.
+
+        Le profil est persisté avec le token : au redémarrage, il est relu
+        depuis .storage sans requête tant que profile_ttl n'est pas écoulé.
+        """
+        if not force and self._profile_fetched_at and time.time() - self._profile_fetched_at < self.profile_ttl:
+            return self.profile
+
+        await self._ensure_token()
+        data = await self._make_read_request(self.endpoints["mine_info"], {})
+        if not data or data.get('code') != '000' or not isinstance(data.get('data'), dict):
+            error_msg = data.get('msg', 'Unknown error') if data else "No response"
+            _LOGGER.warning(f"MarsPro profile unavailable: {error_msg}")
+            return self.profile
+
+        self.profile = {**self.profile, **data['data']}
+        self._profile_fetched_at = time.time()
+        _LOGGER.info(f"MarsPro profile cached for user {self.user_id}")
+        await self._save_store()
+        return self.profile
+
+    async def _relogin(self, stale_token):
+        """Se reconnecter une seule fois même si plusieurs requêtes voient le token expirer"""
+        async with self._login_lock:
+            if self.token and self.token != stale_token:
+                return  # Déjà renouvelé par un autre appelant
+            await self.login()
+
+    async def restore_token(self):
+        """Restaurer token, date d'émission, profil et stratégies depuis le stockage persistant"""
+        if self._store is None:
+            return False
+
+        self._stored = await self._store.async_load() or {}
+        # Ancien format (une stratégie par PID, tous types confondus) : ré-apprendre
+        self.control_strategies = {
+            pid: dict(strategies)
+            for pid, strategies in (self._stored.get("strategies") or {}).items()
+            if "method" not in strategies
+        }
+        profile = self._stored.get("profile") or {}
+        self.profile = dict(profile.get("data") or {})
+        self._profile_fetched_at = profile.get("fetched_at", 0)
+        auth = self._stored.get("token") or {}
+        issued_at = auth.get("issued_at", 0)
+
+        if not auth.get("token") or time.time() >= issued_at + self.token_lifetime:
+            return False
+
+        self.token = auth["token"]
+        if auth.get("user_id") and not self.user_id:
+            self.profile["userId"] = auth["user_id"]  # Stockage antérieur au profil
+        self.last_login_time = issued_at
+        _LOGGER.info("MarsPro token restored from storage, skipping login")
+        return True
+
+    async def _save_token(self):
+        """Persister le token courant"""
+        if self._store is None:
+            return
+
+        self._stored["token"] = {
+            "token": self.token,
+            "issued_at": self.last_login_time,
+        }
+        await self._save_store()
+
+    async def _save_store(self):
+        """Persister token, profil et stratégies apprises dans .storage"""
+        if self._store is None:
+            return
+
+        self._stored["strategies"] = self.control_strategies
+        self._stored["profile"] = {
+            "data": self.profile,
+            "fetched_at": self._profile_fetched_at,
+        }
         try:
-            # Import absolu au lieu de relatif pour éviter les problèmes
-            import sys
-            import os
-            import importlib.util
-            
-            # Obtenir le chemin vers le module API legacy
-            current_dir = os.path.dirname(__file__)
-            api_legacy_path = os.path.join(current_dir, 'api.py')
-            
-            # Charger le module legacy
-            spec = importlib.util.spec_from_file_location("legacy_api", api_legacy_path)
-            legacy_module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(legacy_module)
-            
-            # Créer une instance de l'API legacy
-            self.legacy_api = legacy_module.MarsHydroAPI(self.email, self.password)
-            await self.legacy_api.login()
-            
-            # Copier les données importantes
-            self.token = self.legacy_api.token
-            self.legacy_base_url = self.legacy_api.base_url
-            
+            await self._store.async_save(self._stored)
+        except Exception as e:
+            _LOGGER.warning(f"Could not persist MarsPro data: {e}")
+
+    def start_token_refresh(self):
+        """Démarrer le renouvellement du token en arrière-plan, avant son expiration"""
+        if self._token_refresh_task is None or self._token_refresh_task.done():
+            self._token_refresh_task = asyncio.create_task(self._token_refresh_loop())
+
+    async def _token_refresh_loop(self):
+        """Renouveler le token token_refresh_margin secondes avant son expiration"""
+        while True:
+            refresh_at = self.last_login_time + self.token_lifetime - self.token_refresh_margin
+            await asyncio.sleep(max(refresh_at - time.time(), 0))
+
+            try:
+                _LOGGER.info("Refreshing MarsPro token before expiry")
+                await self._relogin(self.token)
+            except Exception as e:
+                _LOGGER.warning(f"MarsPro token refresh failed, retrying later: {e}")
+                await asyncio.sleep(TOKEN_REFRESH_RETRY_DELAY)
+
+    async def _fallback_to_legacy_api(self):
+        """Préparer le backend legacy MarsHydro, une seule fois, et le garder chaud.
+
+        Le client legacy conserve sa propre session et son propre token : le
+        token MarsPro n'est jamais écrasé par celui de l'autre backend.
+        """
+        async with self._legacy_lock:
+            if self.legacy_api is not None:
+                return self.legacy_api
+
+            legacy_api = MarsHydroAPI(
+                self.email,
+                self.password,
+                scheduler=self.scheduler,
+                session=None if self._owns_session else self._session,
+            )
+            try:
+                await legacy_api.login()
+            except asyncio.CancelledError:
+                await legacy_api.close()
+                raise
+            except Exception as e:
+                await legacy_api.close()
+                self.legacy_healthy = False
+                _LOGGER.error(f"Fallback to legacy API failed: {e}")
+                raise Exception(f"Both MarsPro and legacy MarsHydro APIs failed. MarsPro: No valid credentials, Legacy: {e}")
+
+            self.legacy_api = legacy_api
+            self.legacy_base_url = legacy_api.base_url
+            self.legacy_healthy = True
+            # Peut être atteint depuis une commande : la boucle reste en arrière-plan
+            self._legacy_health_task = create_background_task(
+                self._legacy_health_loop(), name="marshydro_legacy_health"
+            )
             _LOGGER.info("Fallback to legacy API successful")
-            
+            return legacy_api
+
+    def start_legacy_warmup(self):
+        """Préparer le backend legacy en arrière-plan (tâche annulée par close())"""
+        if self._legacy_warmup_task is None or self._legacy_warmup_task.done():
+            self._legacy_warmup_task = create_background_task(
+                self.warm_legacy_backend(), name="marshydro_legacy_warmup"
+            )
+
+    async def warm_legacy_backend(self):
+        """Préparer le backend legacy dès le démarrage, avant qu'un basculement n'en ait besoin"""
+        try:
+            await self._fallback_to_legacy_api()
         except Exception as e:
-            _LOGGER.error(f"Fallback to legacy API failed: {e}")
-            raise Exception(f"Both MarsPro and legacy MarsHydro APIs failed. MarsPro: No valid credentials, Legacy: {e}")
+            # Nouvelle tentative au premier basculement
+            _LOGGER.warning(f"Could not warm up the legacy MarsHydro API: {e}")
+
+    async def _legacy_health_loop(self):
+        """Vérifier périodiquement le backend legacy pour garder session et token chauds"""
+        while True:
+            await asyncio.sleep(self.legacy_health_interval)
+
+            try:
+                # Le client legacy ne lève pas sur un code d'erreur (token expiré...) :
+                # il journalise et ne retourne aucun appareil
+                lightdata = await self.legacy_api.get_lightdata()
+                error = None if lightdata else "no device returned"
+            except Exception as e:
+                error = e
+
+            if error is None:
+                if not self.legacy_healthy:
+                    _LOGGER.info("Legacy MarsHydro API is healthy again")
+                self.legacy_healthy = True
+            else:
+                _LOGGER.warning(f"Legacy MarsHydro API health check failed: {error}")
+                self.legacy_healthy = False
+                # Forcer une nouvelle connexion au prochain appel
+                self.legacy_api.token = None
 
     async def _fallback_get_lightdata(self):
         """Récupérer les données d'éclairage via l'API legacy"""
-        if hasattr(self, 'legacy_api'):
+        if self.legacy_api is not None:
             return await self.legacy_api.get_lightdata()
         else:
             raise Exception("Legacy API not initialized")
 
     async def _fallback_get_fandata(self):
         """Récupérer les données de ventilateur via l'API legacy"""
-        if hasattr(self, 'legacy_api'):
+        if self.legacy_api is not None:
             return await self.legacy_api.get_fandata()
         else:
             raise Exception("Legacy API not initialized")
 
     async def safe_api_call(self, func, *args, **kwargs):
-        """Ensure thread-safe API calls."""
-        async with self.api_lock:
-            return await func(*args, **kwargs)
+        """Call the API; concurrency is bounded per request by the scheduler."""
+        return await func(*args, **kwargs)
 
     async def _ensure_token(self):
         """Ensure that the token is valid."""
         if not self.token:
-            await self.login()
+            await self._relogin(None)
 
+    @interactive_command
     async def toggle_switch(self, is_close: bool, device_id: str):
         """Toggle the light or fan switch (on/off) - MarsPro version avec format EXACT des captures."""
         await self._ensure_token()
@@ -192,6 +823,7 @@ class MarsProAPI:
         success = await self.control_device_by_pid(target_pid, not is_close, 100)
         
         if success:
+            self.invalidate_cache()
             _LOGGER.info(f"MarsPro switch toggle successful (PID: {target_pid})")
             return {"code": "000", "msg": "success"}
         else:
@@ -211,97 +843,225 @@ class MarsProAPI:
             }
         }
         
-        payload = {"data": json.dumps(inner_data)}
+        payload = {"data": json_dumps(inner_data)}
         endpoint = "/api/upData/device"  # Endpoint legacy
         
-        return await self._make_request(endpoint, payload)
+        async with self.scheduler.device_lock(self.device_serial):
+            return await self._make_request(endpoint, payload)
+
+    async def get_all_devices(self):
+        """Récupérer tous les appareils, toutes pages confondues"""
+        return [device async for device in self.iter_devices()]
+
+    async def get_device_detail(self, device_id, fresh=False):
+        """Récupérer un seul appareil via getDeviceDetail (cache dédié par ID).
+
+        Retourne l'appareil au même format que get_all_devices, ou None.
+        fresh=True ignore le cache (vérification après une commande).
+        """
+        if not fresh:
+            cached = self._detail_cache.get(device_id)
+            if cached is not None:
+                return cached
 
-    async def _process_device_list(self, device_product_group):
-        """Retrieve device list for a given product group - MarsPro version."""
         await self._ensure_token()
-        
-        # Payload exact capturé !
-        payload = {
-            "currentPage": 1,
-            "type": None,
-            "deviceProductGroup": device_product_group
-        }
+        generation = self._cache_generation
+        data = await self._make_read_request(self.endpoints["device_detail"], {"deviceId": device_id})
 
-        # ENDPOINT EXACT QUI MARCHE !
-        endpoint = "/api/android/udm/getDeviceList/v1"
-        
-        data = await self._make_request(endpoint, payload)
-        
-        if data and data.get("code") == "000":
-            device_list = data.get("data", {}).get("list", [])
-            _LOGGER.info(f"MarsPro found {len(device_list)} devices")
-            return device_list
-        else:
+        if not data or data.get('code') != '000' or not data.get('data'):
             error_msg = data.get('msg', 'Unknown error') if data else "No response"
-            _LOGGER.error(f"Device list failed: {error_msg}")
-            return []
+            _LOGGER.warning(f"MarsPro device detail failed for {device_id}: {error_msg}")
+            return None
 
-    async def get_all_devices(self):
-        """Récupérer tous les appareils avec les VRAIS paramètres des captures réseau"""
+        detail = self._process_device({"id": device_id, **data['data']})
+        self._remember_pids([detail])
+        # Comme pour le cache des réponses : pas de détail antérieur à une commande
+        if generation == self._cache_generation:
+            self._detail_cache.set(device_id, detail, self.detail_ttl)
+        return detail
+
+    async def iter_devices(self, groups=None):
+        """Générateur asynchrone des appareils, au fil de l'arrivée des pages"""
+        async for devices in self.iter_device_pages(groups):
+            for device in devices:
+                yield device
+
+    async def iter_device_pages(self, groups=None):
+        """Générateur asynchrone des pages d'appareils de tous les groupes de produits.
+
+        Les groupes sont interrogés en parallèle ; les pages sont produites dans
+        leur ordre d'arrivée, dédoublonnées par ID d'appareil. Les groupes
+        trouvés vides sont ignorés pendant EMPTY_GROUP_TTL secondes.
+
+        Si une page n'a pas pu être récupérée, l'exception est levée une fois
+        les autres pages produites : la liste est incomplète, l'appelant ne
+        doit pas en conclure que les appareils manquants ont disparu.
+        """
+        now = time.monotonic()
+        groups = [
+            group for group in (groups or self.product_groups)
+            if now - self._empty_groups.get(group, -EMPTY_GROUP_TTL) >= EMPTY_GROUP_TTL
+        ]
+        queue = asyncio.Queue()
+        errors = []
+
+        async def pump(group):
+            pages = found = 0
+            try:
+                async for page in self._iter_group_pages(group):
+                    pages += 1
+                    found += len(page)
+                    await queue.put(page)
+            except Exception as e:
+                _LOGGER.error(f"MarsPro discovery failed for product group {group}: {e}")
+                errors.append(e)
+                return
+            finally:
+                await queue.put(None)
+
+            # Groupe interrogé avec succès mais sans appareil : l'ignorer un temps
+            if pages and not found:
+                _LOGGER.debug(f"MarsPro product group {group} is empty, skipping it for {EMPTY_GROUP_TTL}s")
+                self._empty_groups[group] = time.monotonic()
+            elif found:
+                self._empty_groups.pop(group, None)
+
+        tasks = [asyncio.ensure_future(pump(group)) for group in groups]
+        remaining = len(tasks)
+        seen = set()
+        try:
+            while remaining:
+                page = await queue.get()
+                if page is None:
+                    remaining -= 1
+                    continue
+
+                fresh = [device for device in page if device['id'] not in seen]
+                seen.update(device['id'] for device in fresh)
+                if fresh:
+                    yield fresh
+
+            if errors:
+                raise errors[0]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _iter_group_pages(self, group):
+        """Générateur asynchrone des pages d'appareils d'un groupe de produits.
+
+        La première page donne le nombre total d'appareils ; les pages suivantes
+        sont alors demandées en parallèle (au plus page_concurrency à la fois)
+        et produites dans leur ordre d'arrivée.
+        """
         await self._ensure_token()
-        
-        # Payload EXACT basé sur les captures réseau - L'appareil est dans le groupe 1 !
+
+        first = await self._fetch_device_page(1, group)
+        if first is None:
+            raise Exception(f"MarsPro device list page 1 of product group {group} failed")
+
+        devices, total = first
+        yield devices
+
+        if not devices or not total or total <= len(devices):
+            return
+
+        page_count = math.ceil(total / len(devices))
+        _LOGGER.debug(f"MarsPro device list has {total} devices over {page_count} pages")
+        semaphore = asyncio.Semaphore(self.page_concurrency)
+
+        async def fetch(page):
+            async with semaphore:
+                return await self._fetch_device_page(page, group)
+
+        tasks = [asyncio.ensure_future(fetch(page)) for page in range(2, page_count + 1)]
+        try:
+            for next_page in asyncio.as_completed(tasks):
+                result = await next_page
+                if result is None:
+                    raise Exception(f"MarsPro device list page of product group {group} failed")
+                yield result[0]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _fetch_device_page(self, page, group):
+        """Récupérer une page de la liste d'appareils : (appareils, total) ou None"""
+        # Payload EXACT basé sur les captures réseau
         payload = {
-            "currentPage": 1,
+            "currentPage": page,
             "type": None,  # Valeur null exacte des captures
-            "deviceProductGroup": 1  # CORRECTION : L'appareil est dans le groupe 1, pas 2 !
+            "deviceProductGroup": group,
+        }
+
+        data = await self._make_read_request(self.endpoints["device_list"], payload)
+
+        if not data or data.get('code') != '000':
+            error_msg = data.get('msg', 'Unknown error') if data else "No response"
+            _LOGGER.error(f"Échec récupération appareils MarsPro (groupe {group}, page {page}): {error_msg}")
+            return None
+
+        body = data.get('data') or {}
+        devices = [self._process_device(device) for device in body.get('list') or []]
+        _LOGGER.info(f"MarsPro trouvé {len(devices)} appareils dans le groupe {group} (page {page})")
+        self._remember_pids(devices)
+        return devices, body.get('total')
+
+    @staticmethod
+    def _process_device(device):
+        """Extraire les informations RÉELLES d'un appareil selon les captures"""
+        device_info = {
+            'id': device.get('id'),  # ID réel: 129245
+            'name': device.get('deviceName', f"MarsPro Device {device.get('id')}"),
+            'pid': None,  # Pas de PID dans deviceName selon les captures
+            'device_code': device.get('deviceCode'),  # null dans les captures
+            'product_id': device.get('productId'),  # 17 dans les captures
+            'is_net_device': device.get('isNetDevice', False),  # false dans les captures
+            'mesh_net_id': device.get('meshNetId'),  # null dans les captures
+            'user_id': device.get('userId'),  # 17866 dans les captures
+            'device_img': device.get('deviceImg', ''),
+            'raw_device': device  # Garder les données brutes pour debug
         }
         
-        data = await self._make_request(self.endpoints["device_list"], payload)
+        # Tenter d'extraire le PID depuis d'autres champs ou patterns
+        # Selon les captures, deviceCode est null, donc essayer d'autres méthodes
+        if device.get('deviceCode'):
+            device_info['pid'] = device.get('deviceCode')
+        elif device.get('deviceName'):
+            # Chercher un pattern de PID dans le nom (12 caractères hexadécimaux)
+            pid_match = re.search(r'([A-F0-9]{12})', device.get('deviceName', ''))
+            if pid_match:
+                device_info['pid'] = pid_match.group(1)
         
-        if data and data.get('code') == '000':
-            devices = data.get('data', {}).get('list', [])
-            _LOGGER.info(f"MarsPro trouvé {len(devices)} appareils dans le groupe 1")
-            
-            processed_devices = []
-            for device in devices:
-                # Extraire les informations RÉELLES selon les captures
-                device_info = {
-                    'id': device.get('id'),  # ID réel: 129245
-                    'name': device.get('deviceName', f"MarsPro Device {device.get('id')}"),
-                    'pid': None,  # Pas de PID dans deviceName selon les captures
-                    'device_code': device.get('deviceCode'),  # null dans les captures
-                    'product_id': device.get('productId'),  # 17 dans les captures
-                    'is_net_device': device.get('isNetDevice', False),  # false dans les captures
-                    'mesh_net_id': device.get('meshNetId'),  # null dans les captures
-                    'user_id': device.get('userId'),  # 17866 dans les captures
-                    'device_img': device.get('deviceImg', ''),
-                    'raw_device': device  # Garder les données brutes pour debug
-                }
-                
-                # Tenter d'extraire le PID depuis d'autres champs ou patterns
-                # Selon les captures, deviceCode est null, donc essayer d'autres méthodes
-                if device.get('deviceCode'):
-                    device_info['pid'] = device.get('deviceCode')
-                elif device.get('deviceName'):
-                    # Chercher un pattern de PID dans le nom (12 caractères hexadécimaux)
-                    pid_match = re.search(r'([A-F0-9]{12})', device.get('deviceName', ''))
-                    if pid_match:
-                        device_info['pid'] = pid_match.group(1)
-                
-                # Si isNetDevice est false, c'est probablement un appareil Bluetooth
-                if not device_info['is_net_device']:
-                    device_info['connection_type'] = 'bluetooth'
-                    _LOGGER.info(f"Appareil Bluetooth détecté: {device_info['name']}")
-                else:
-                    device_info['connection_type'] = 'wifi'
-                
-                processed_devices.append(device_info)
-                _LOGGER.info(f"Appareil trouvé: ID={device_info['id']}, Nom={device_info['name']}, Type={device_info['connection_type']}")
-            
-            return processed_devices
+        # Si isNetDevice est false, c'est probablement un appareil Bluetooth
+        if not device_info['is_net_device']:
+            device_info['connection_type'] = 'bluetooth'
+            _LOGGER.info(f"Appareil Bluetooth détecté: {device_info['name']}")
         else:
-            error_msg = data.get('msg', 'Unknown error') if data else "No response"
-            _LOGGER.error(f"Échec récupération appareils MarsPro: {error_msg}")
-            return []
+            device_info['connection_type'] = 'wifi'
+        
+        _LOGGER.info(f"Appareil trouvé: ID={device_info['id']}, Nom={device_info['name']}, Type={device_info['connection_type']}")
+        return device_info
 
     async def get_lightdata(self):
         """Get light data using confirmed MarsPro endpoints."""
+        if self.hedge_reads:
+            return await self._hedged_lightdata()
+
+        device = await self._marspro_lightdata()
+        if device:
+            return device
+
+        _LOGGER.warning("No devices found in MarsPro, trying fallback...")
+        # Fallback vers l'API legacy si aucun dispositif trouvé
+        try:
+            return await self._legacy_lightdata()
+        except Exception as e:
+            _LOGGER.error(f"Both MarsPro and fallback failed: {e}")
+            return None
+
+    async def _marspro_lightdata(self):
+        """Dispositif principal vu par le cloud MarsPro (None si aucun)"""
         await self._ensure_token()
 
         # Utiliser la nouvelle méthode avec le bon payload
@@ -324,15 +1084,81 @@ class MarsProAPI:
             device["device_pid_stable"] = self.device_serial
             
             return device
-        
-        _LOGGER.warning("No devices found in MarsPro, trying fallback...")
-        # Fallback vers l'API legacy si aucun dispositif trouvé
+
+        return None
+
+    async def _legacy_lightdata(self):
+        """Dispositif principal vu par le backend legacy MarsHydro"""
+        await self._fallback_to_legacy_api()
+        return await self._fallback_get_lightdata()
+
+    async def _timed_backend_read(self, backend):
+        """Lire via un backend en mesurant la latence des réponses valides"""
+        fetch = self._marspro_lightdata if backend == "marspro" else self._legacy_lightdata
+        started = time.monotonic()
         try:
-            await self._fallback_to_legacy_api()
-            return await self._fallback_get_lightdata()
+            result = await fetch()
         except Exception as e:
-            _LOGGER.error(f"Both MarsPro and fallback failed: {e}")
+            _LOGGER.debug(f"Hedged read via {backend} failed: {e}")
             return None
+        if result:
+            self.backend_latency.record(backend, time.monotonic() - started)
+        return result
+
+    def _hedge_delay(self, backend):
+        """Attente avant de lancer le second backend : percentile observé du premier"""
+        if self.backend_latency.count(backend) < HEDGE_MIN_SAMPLES:
+            return DEFAULT_HEDGE_DELAY
+        return self.backend_latency.percentile(backend, self.hedge_percentile)
+
+    def _record_backend_win(self, backend):
+        """Noter le gagnant ; l'ordre s'inverse après BACKEND_SWITCH_WINS victoires d'affilée"""
+        self.read_backend_wins[backend] += 1
+        previous, streak = self._win_streak
+        streak = streak + 1 if previous == backend else 1
+        self._win_streak = (backend, streak)
+
+        if backend != self.preferred_read_backend and streak >= BACKEND_SWITCH_WINS:
+            _LOGGER.info(f"Preferring {backend} backend for reads after {streak} consecutive wins")
+            self.preferred_read_backend = backend
+
+    async def _hedged_lightdata(self):
+        """Lecture couverte : le backend préféré d'abord, l'autre s'il tarde.
+
+        La première réponse valide l'emporte ; la requête perdante termine en
+        arrière-plan pour continuer d'alimenter les statistiques de latence,
+        sauf pour une commande utilisateur : elle garderait la priorité
+        interactive et ferait servir le polling depuis le cache.
+        """
+        primary = self.preferred_read_backend
+        secondary = READ_BACKENDS[1] if primary == READ_BACKENDS[0] else READ_BACKENDS[0]
+
+        tasks = {asyncio.ensure_future(self._timed_backend_read(primary)): primary}
+        done, _ = await asyncio.wait(tasks, timeout=self._hedge_delay(primary))
+        if not done or not next(iter(done)).result():
+            _LOGGER.debug(f"Hedging read: {primary} slow or empty, querying {secondary}")
+            tasks[asyncio.ensure_future(self._timed_backend_read(secondary))] = secondary
+
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result:
+                        self._record_backend_win(tasks[task])
+                        return result
+        finally:
+            interactive = not is_background_request()
+            for task in pending:
+                if interactive:
+                    task.cancel()
+                    continue
+                self._hedge_tasks.add(task)
+                task.add_done_callback(self._hedge_tasks.discard)
+
+        _LOGGER.error("Both MarsPro and legacy backends returned no device")
+        return None
 
     async def get_fandata(self):
         """Get fan data using confirmed MarsPro endpoints."""
@@ -340,6 +1166,7 @@ class MarsProAPI:
         # car les ventilateurs sont souvent intégrés aux dispositifs d'éclairage
         return await self.get_lightdata()
 
+    @interactive_command
     async def set_brightness(self, brightness):
         """Set the brightness of the MarsPro light avec format outletCtrl simple des captures."""
         await self._ensure_token()
@@ -351,10 +1178,18 @@ class MarsProAPI:
                 _LOGGER.error("Cannot set brightness: no device data available")
                 return
 
+        # Pendant un glissement du curseur, seule la dernière luminosité est envoyée
+        return await self._command_coalescer.submit(
+            (self.device_serial, "brightness"), brightness, self._apply_brightness
+        )
+
+    async def _apply_brightness(self, brightness):
+        """Envoyer la luminosité au dispositif courant"""
         # Utiliser la nouvelle méthode de contrôle par PID
-        success = await self.control_device_by_pid(self.device_serial, True, brightness)
+        success = await self._control_device_by_pid(self.device_serial, True, brightness)
         
         if success:
+            self.invalidate_cache()
             _LOGGER.info(f"MarsPro brightness set to {brightness}% (PID: {self.device_serial})")
             return {"code": "000", "msg": "success"}
         else:
@@ -362,36 +1197,71 @@ class MarsProAPI:
             _LOGGER.error(error_msg)
             raise Exception(error_msg)
 
-    async def _wakeup_bluetooth_device(self):
-        """Réveiller un appareil Bluetooth avant de l'utiliser"""
+    def _mark_awake(self, pid: str):
+        """Noter une interaction acceptée pour l'appareil (présumé éveillé, non vérifié)"""
+        if pid:
+            self._last_awake[pid] = time.monotonic()
+
+    def _is_awake(self, pid: str):
+        """True si la dernière interaction réussie date de moins de wakeup_threshold"""
+        last_awake = self._last_awake.get(pid)
+        return last_awake is not None and time.monotonic() - last_awake < self.wakeup_threshold
+
+    async def _wakeup_bluetooth_device(self, pid: str = None):
+        """Réveiller un appareil Bluetooth avant de l'utiliser, seulement s'il a pu se rendormir.
+
+        Seul le relais cloud acquitte la trame wakeup (réponse upData code
+        000) : ni l'API ni getDeviceDetail n'exposent l'état d'éveil de
+        l'appareil, qui n'est donc pas confirmé. Si l'appareil dort encore, la
+        commande qui suit échoue et la cascade de control_device_hybrid prend
+        le relais.
+        """
+        pid = pid or self.device_serial
+        if self._is_awake(pid):
+            self.wakeups_skipped += 1
+            _LOGGER.debug(f"Bluetooth device {pid} recently active, skipping wakeup")
+            return True
+        
         try:
             inner_data = {
                 "method": "wakeup",
                 "params": {
-                    "deviceSerialnum": self.device_serial
+                    "deviceSerialnum": pid
                 }
             }
             
-            payload = {"data": json.dumps(inner_data)}
+            payload = {"data": json_dumps(inner_data)}
             endpoint = "/api/upData/device"
             
             _LOGGER.debug("Waking up Bluetooth device...")
+            # Acquittement du relais cloud uniquement (pas de l'appareil), pas de délai fixe
             data = await self._make_request(endpoint, payload)
             
             if data and data.get("code") == "000":
                 _LOGGER.info("Bluetooth device wakeup successful")
-                # Petit délai pour laisser l'appareil se réveiller
-                await asyncio.sleep(1)
-            else:
-                _LOGGER.warning(f"Bluetooth device wakeup failed: {data}")
+                self._mark_awake(pid)
+                return True
+            
+            _LOGGER.warning(f"Bluetooth device wakeup failed: {data}")
                 
         except Exception as e:
             _LOGGER.warning(f"Bluetooth device wakeup error: {e}")
+        return False
 
+    @interactive_command
     async def set_fanspeed(self, speed, fan_device_id):
         """Set the speed of the MarsPro fan avec format outletCtrl simple des captures."""
         await self._ensure_token()
 
+        # Pendant un glissement du curseur, seule la dernière vitesse est envoyée
+        return await self._command_coalescer.submit(
+            (self.device_serial or fan_device_id, "fan_speed"),
+            speed,
+            lambda value: self._apply_fanspeed(value, fan_device_id),
+        )
+
+    async def _apply_fanspeed(self, speed, fan_device_id):
+        """Envoyer la vitesse du ventilateur"""
         # Format EXACT de la capture 3 : outletCtrl simple pour ventilateur
         inner_data = {
             "method": "outletCtrl",  # Format SIMPLE capturé !
@@ -403,15 +1273,19 @@ class MarsProAPI:
             }
         }
 
-        payload = {"data": json.dumps(inner_data)}
+        payload = {"data": json_dumps(inner_data)}
 
-        _LOGGER.debug(f"MarsPro fan speed payload (outletCtrl format): {json.dumps(payload, indent=2)}")
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug(f"MarsPro fan speed payload (outletCtrl format): {json.dumps(payload, indent=2)}")
 
         endpoint = "/api/upData/device"  # Endpoint réel capturé
         
-        data = await self._make_request(endpoint, payload)
+        async with self.scheduler.device_lock(inner_data["params"]["pid"]):
+            data = await self._make_request(endpoint, payload)
         
         if data and data.get("code") == "000":
+            self.invalidate_cache()
+            self._mark_awake(inner_data["params"]["pid"])
             _LOGGER.info(f"MarsPro fan speed set to {speed}% successfully (outletCtrl format)")
             return data
         else:
@@ -421,19 +1295,7 @@ class MarsProAPI:
 
     def _generate_system_data(self):
         """Generate systemData payload for MarsPro with EXACT data from network captures."""
-        return {
-            "reqId": str(random.randint(10000000000, 99999999999)),  # Comme dans les captures
-            "appVersion": "1.3.2",  # Version EXACTE des captures
-            "osType": "android",
-            "osVersion": "15",      # Version EXACTE des captures
-            "deviceType": "SM-S928B",  # Type EXACT des captures
-            "deviceId": "AP3A.240905.015.A2",  # ID EXACT des captures
-            "netType": "wifi",
-            "wifiName": "unknown",  # Valeur EXACTE des captures
-            "timestamp": str(int(time.time())),
-            "timezone": "34",       # Timezone EXACTE des captures
-            "language": "French"    # Langue comme dans les captures
-        }
+        return json_loads(self._systemdata_header())
 
     async def get_device_by_name(self, device_name: str):
         """Récupérer un appareil spécifique par son nom"""
@@ -448,10 +1310,74 @@ class MarsProAPI:
         _LOGGER.warning(f"Device '{device_name}' not found")
         return None
 
+    @interactive_command
     async def control_device_by_pid(self, pid: str, on: bool, pwm: int = 100):
-        """Contrôler l'appareil par PID avec le FORMAT EXACT des captures réseau"""
+        """Contrôler l'appareil par PID ; les commandes rapprochées sont coalescées (la dernière gagne)"""
+        success, _ = await self._submit_pid_command(pid, on, pwm)
+        return success
+
+    @interactive_command
+    async def turn_on_device(self, device_id, brightness: int = 100):
+        """Allumer un appareil (ID cloud) à la luminosité demandée, en %"""
+        return await self._control_device(device_id, True, brightness)
+
+    @interactive_command
+    async def turn_off_device(self, device_id):
+        """Éteindre un appareil (ID cloud)"""
+        return await self._control_device(device_id, False)
+
+    async def _control_device(self, device_id, on: bool, pwm: int = 100):
+        """Commander un appareil par son ID cloud et prévenir les abonnés en cas de succès"""
+        pid = await self._pid_for_device(device_id)
+        if not pid:
+            _LOGGER.error(f"No PID known for MarsPro device {device_id}")
+            return False
+
+        success = await self.control_device_by_pid(pid, on, pwm)
+        if success:
+            for listener in list(self._command_listeners):
+                listener(device_id)
+        return success
+
+    def add_command_listener(self, listener):
+        """Appeler listener(device_id) après chaque commande réussie ; retourne la désinscription"""
+        self._command_listeners.append(listener)
+        return lambda: self._command_listeners.remove(listener)
+
+    def _remember_pids(self, devices):
+        """Mémoriser le PID de chaque appareil traité"""
+        for device in devices:
+            if device.get('pid'):
+                self._device_pids[device['id']] = device['pid']
+
+    async def _pid_for_device(self, device_id):
+        """PID d'un appareil cloud : déjà vu dans une liste, sinon via getDeviceDetail"""
+        pid = self._device_pids.get(device_id)
+        if pid is None:
+            detail = await self.get_device_detail(device_id)
+            pid = detail.get('pid') if detail else None
+        return pid
+
+    async def _submit_pid_command(self, pid: str, on: bool, pwm: int = 100):
+        """Commande PID coalescée ; retourne (succès, résultats du pipeline envoyé)"""
+        return await self._command_coalescer.submit(
+            (pid, "power"), (on, pwm), lambda value: self._send_pid_command(pid, *value)
+        )
+
+    async def _control_device_by_pid(self, pid: str, on: bool, pwm: int = 100):
+        """Contrôler l'appareil par PID sans coalescence"""
+        success, _ = await self._send_pid_command(pid, on, pwm)
+        return success
+
+    async def _send_pid_command(self, pid: str, on: bool, pwm: int = 100):
+        """Contrôler l'appareil par PID avec le FORMAT EXACT des captures réseau.
+
+        Retourne (succès, résultats) : les résultats du pipeline de cette
+        commande, pas ceux de la dernière commande du compte.
+        """
         await self._ensure_token()
         
+        results = []
         try:
             _LOGGER.info(f"MarsPro contrôle appareil: PID={pid}, on={on}, pwm={pwm}")
             
@@ -464,7 +1390,6 @@ class MarsProAPI:
                     {
                         "method": "setDeviceActive",
                         "pid": pid,
-                        "msgId": "1", 
                         "msg": "1",
                         "code": 200,
                         "active": True
@@ -472,7 +1397,6 @@ class MarsProAPI:
                     {
                         "method": "setBrightness", 
                         "pid": pid,
-                        "msgId": "2",
                         "msg": "1", 
                         "code": 200,
                         "brightness": pwm
@@ -484,47 +1408,77 @@ class MarsProAPI:
                     {
                         "method": "setDeviceActive",
                         "pid": pid, 
-                        "msgId": "1",
                         "msg": "1",
                         "code": 200,
                         "active": False
                     }
                 ]
             
-            # Envoyer chaque commande avec le format exact des captures
-            success_count = 0
-            for i, command in enumerate(commands):
-                
-                # Payload EXACT format des captures : data contient JSON stringifié
-                payload = {
-                    "data": json.dumps(command)  # JSON stringifié comme dans les captures
-                }
-                
-                _LOGGER.debug(f"Commande {i+1}/{len(commands)}: {json.dumps(payload, indent=2)}")
-                
-                data = await self._make_request(self.endpoints["device_control"], payload)
-                
-                if data and data.get('code') == '000':
-                    success_count += 1
-                    _LOGGER.info(f"Commande {i+1} réussie: {command['method']}")
-                else:
-                    _LOGGER.error(f"Commande {i+1} échouée: {data}")
-                
-                # Petit délai entre les commandes
-                await asyncio.sleep(0.5)
+            # Envoyer les commandes à la suite sur la session partagée, sans délai fixe
+            async with self.scheduler.device_lock(pid):
+                results = await self._send_command_pipeline(commands)
+            self.last_command_results = results
+            success_count = sum(1 for result in results if result["success"])
             
             total_success = success_count == len(commands)
             
             if total_success:
+                self.invalidate_cache()
                 _LOGGER.info(f"Contrôle MarsPro réussi: {pid} -> on={on}, pwm={pwm}")
             else:
                 _LOGGER.warning(f"Contrôle MarsPro partiel: {success_count}/{len(commands)} commandes réussies")
             
-            return total_success
+            return total_success, results
             
         except Exception as e:
             _LOGGER.error(f"Erreur contrôle MarsPro: {e}")
-            return False
+            return False, results
+
+    async def _send_command_pipeline(self, commands):
+        """Envoyer une série de trames de méthode et retourner le résultat de chacune.
+
+        Chaque trame reçoit un msgId réel et incrémental ; la réponse est associée
+        à sa commande (et vérifiée si le cloud renvoie le msgId).
+        """
+        results = []
+        for command in commands:
+            msg_id = str(next(self._msg_ids))
+
+            # msgId juste après le pid, comme dans les captures
+            frame = {}
+            for field, value in command.items():
+                frame[field] = value
+                if field == "pid":
+                    frame["msgId"] = msg_id
+            frame.setdefault("msgId", msg_id)
+
+            # Payload EXACT format des captures : data contient JSON stringifié
+            payload = {"data": json_dumps(frame)}
+            if _LOGGER.isEnabledFor(logging.DEBUG):
+                _LOGGER.debug(f"Commande {frame['method']} (msgId={msg_id}): {payload}")
+
+            data = await self._make_request(self.endpoints["device_control"], payload)
+
+            success = bool(data) and data.get('code') == '000'
+            response_data = data.get('data') if data else None
+            echoed_id = response_data.get('msgId') if isinstance(response_data, dict) else None
+            if success and echoed_id is not None and str(echoed_id) != msg_id:
+                _LOGGER.warning(f"Réponse msgId={echoed_id} inattendue pour la commande msgId={msg_id}")
+                success = False
+
+            if success:
+                self._mark_awake(frame.get("pid"))
+                _LOGGER.info(f"Commande réussie: {frame['method']} (msgId={msg_id})")
+            else:
+                _LOGGER.error(f"Commande échouée: {frame['method']} (msgId={msg_id}): {data}")
+
+            results.append({
+                "method": frame["method"],
+                "msgId": msg_id,
+                "success": success,
+                "response": data,
+            })
+        return results
 
     def stop_heartbeat(self):
         """Arrêter le système de heartbeat"""
@@ -747,8 +1701,12 @@ class MarsProAPI:
             await self.ble_client.disconnect()
             _LOGGER.info("Disconnected from BLE device")
 
-    async def _ble_control_device(self, on: bool, pwm: int = 100):
-        """Contrôler l'appareil via Bluetooth BLE direct avec protocoles multiples"""
+    async def _ble_control_device(self, on: bool, pwm: int = 100, ble_char=None, ble_frame=None):
+        """Contrôler l'appareil via Bluetooth BLE direct avec protocoles multiples.
+
+        Si ble_char/ble_frame (appris) sont fournis, seule cette combinaison est
+        essayée. La combinaison qui réussit est gardée dans last_ble_strategy.
+        """
         if not self.bluetooth_support or not self.ble_device:
             _LOGGER.error("BLE control not available")
             return False
@@ -809,26 +1767,33 @@ class MarsProAPI:
                 bytes([0x01, 0x02, on_byte, pwm_byte, 0x03, 0x04]),
             ]
             
+            # Combinaison apprise : aller directement à la bonne caractéristique / trame
+            if ble_char is not None and ble_frame is not None and ble_frame < len(protocols):
+                write_characteristics = [
+                    char for char in write_characteristics if str(char.uuid) == ble_char
+                ]
+                protocols = [protocols[ble_frame]]
+            
             # Essayer chaque protocole sur chaque caractéristique
             for i, char in enumerate(write_characteristics):
                 _LOGGER.info(f"Trying characteristic {i+1}: {char.uuid}")
                 
                 for j, protocol in enumerate(protocols):
+                    frame_index = ble_frame if ble_frame is not None else j
                     try:
                         _LOGGER.debug(f"  Protocol {j+1}: {protocol.hex()}")
                         
                         # Essayer write avec réponse
                         try:
                             await self.ble_client.write_gatt_char(char.uuid, protocol, response=True)
-                            _LOGGER.info(f"BLE write successful (char {i+1}, protocol {j+1}): on={on}, pwm={pwm}")
-                            await asyncio.sleep(2)  # Attendre l'effet
-                            return True
+                            _LOGGER.info(f"BLE write successful (char {i+1}, protocol {frame_index+1}): on={on}, pwm={pwm}")
                         except:
                             # Essayer write sans réponse
                             await self.ble_client.write_gatt_char(char.uuid, protocol, response=False)
-                            _LOGGER.info(f"BLE write-without-response successful (char {i+1}, protocol {j+1}): on={on}, pwm={pwm}")
-                            await asyncio.sleep(2)  # Attendre l'effet
-                            return True
+                            _LOGGER.info(f"BLE write-without-response successful (char {i+1}, protocol {frame_index+1}): on={on}, pwm={pwm}")
+                        self.last_ble_strategy = (str(char.uuid), frame_index)
+                        await asyncio.sleep(2)  # Attendre l'effet
+                        return True
                             
                     except Exception as e:
                         _LOGGER.debug(f"  Protocol {j+1} failed: {e}")
@@ -844,8 +1809,14 @@ class MarsProAPI:
             # Garder la connexion ouverte pour les prochaines commandes
             pass
 
+    @interactive_command
     async def control_device_hybrid(self, on: bool, pwm: int = 100):
-        """Contrôle hybride optimisé: WiFi Cloud prioritaire, BLE en fallback"""
+        """Contrôle hybride optimisé: WiFi Cloud prioritaire, BLE en fallback.
+
+        La première méthode qui réussit pour un PID est apprise et persistée ;
+        les commandes suivantes l'utilisent directement et ne reparcourent la
+        cascade complète que si elle échoue.
+        """
         _LOGGER.info(f"Starting optimized hybrid control: on={on}, pwm={pwm}")
         
         # Étape 1: Détecter le mode si pas déjà fait
@@ -853,80 +1824,193 @@ class MarsProAPI:
             _LOGGER.info("Detecting device mode...")
             await self.detect_device_mode()
         
-        # PRIORITÉ 1: Contrôle Cloud WiFi (plus fiable et recommandé)
-        _LOGGER.info("Attempting Cloud API control (recommended approach)...")
-        
-        # Activation préalable (crucial pour tous les appareils)
-        try:
-            activation_success = await self._activate_device_for_cloud()
-            if activation_success:
-                _LOGGER.info("Device activation successful")
-                await asyncio.sleep(1)  # Attendre que l'activation prenne effet
-            else:
-                _LOGGER.warning("Device activation failed, trying control anyway...")
-        except Exception as e:
-            _LOGGER.warning(f"Device activation error: {e}")
-        
-        # Contrôle par PID via Cloud
         pid = self.device_serial
         if not pid:
             device_data = await self.get_lightdata()
             pid = device_data.get('device_pid_stable') if device_data else None
         
-        if pid:
-            cloud_success = await self.control_device_by_pid(pid, on, pwm)
-            if cloud_success:
-                _LOGGER.info("Cloud API control successful!")
+        # Activation préalable (crucial pour tous les appareils), sautée si encore valide
+        started_at = time.monotonic()
+        await self._ensure_cloud_activation(pid)
+        
+        # Appareil Bluetooth : réveil seulement s'il n'a pas répondu récemment
+        if self.is_bluetooth_device:
+            await self._wakeup_bluetooth_device(pid)
+        
+        # Stratégie apprise pour ce type de commande : aller directement au
+        # chemin qui a déjà fonctionné (un chemin appris pour éteindre ne sait
+        # pas forcément régler la luminosité)
+        kind = self._command_kind(on)
+        learned = self.control_strategies.get(pid, {}).get(kind) if pid else None
+        if learned:
+            _LOGGER.info(f"Using learned {kind} control strategy for {pid}: {learned['method']}")
+            if await self._attempt_control_strategy(learned, on, pwm, pid, started_at):
+                self._mark_awake(pid)
                 return True
+            _LOGGER.warning(f"Learned strategy {learned['method']} failed for {pid}, re-learning...")
+            await self._forget_control_strategy(pid, kind)
         
-        # PRIORITÉ 2: Bluetooth BLE direct (si appareil Bluetooth et bleak disponible)
-        if self.is_bluetooth_device and self.bluetooth_support:
-            _LOGGER.info("Cloud failed, attempting Bluetooth BLE direct control...")
+        # Cascade complète : Cloud, BLE direct, legacy, formats alternatifs
+        for strategy in self._control_cascade(on, pwm, pid):
+            if learned and strategy["method"] == learned["method"] and strategy["method"] != "ble_direct":
+                continue  # Vient d'échouer
             
-            ble_success = await self._ble_control_device(on, pwm)
-            if ble_success:
-                _LOGGER.info("Bluetooth BLE control successful!")
+            _LOGGER.info(f"Attempting control strategy: {strategy['method']}")
+            if await self._attempt_control_strategy(strategy, on, pwm, pid, started_at):
+                self._mark_awake(pid)
+                _LOGGER.info(f"Control strategy {strategy['method']} successful!")
+                await self._learn_control_strategy(pid, kind, strategy)
                 return True
-            else:
-                _LOGGER.warning("Bluetooth BLE control failed...")
         
-        # PRIORITÉ 3: Méthodes legacy en fallback
-        _LOGGER.warning("Primary methods failed, trying legacy fallbacks...")
+        _LOGGER.error("ALL CONTROL METHODS FAILED - device may be offline or needs WiFi configuration")
+        _LOGGER.info("RECOMMENDATION: Configure device to WiFi mode using configure_wifi_marspro.py")
+        return False
+
+    @staticmethod
+    def _command_kind(on: bool):
+        """Type de commande pour l'apprentissage : extinction ou allumage avec luminosité"""
+        return "brightness" if on else "power"
+
+    def _control_cascade(self, on: bool, pwm: int, pid: str):
+        """Chemins de contrôle dans l'ordre de priorité"""
+        cascade = []
         
-        # Legacy set_brightness
-        if on and pwm > 0:
-            try:
-                legacy_response = await self.set_brightness(pwm)
-                if legacy_response and legacy_response.get('code') == '000':
-                    _LOGGER.info("Legacy brightness control successful!")
-                    return True
-            except Exception as e:
-                _LOGGER.debug(f"Legacy brightness failed: {e}")
+        # PRIORITÉ 1: Contrôle Cloud WiFi (plus fiable et recommandé)
+        if pid:
+            cascade.append({"method": "cloud_pid"})
         
-        # Legacy toggle_switch
-        try:
-            toggle_response = await self.toggle_switch(not on, pid or "")
-            if toggle_response and toggle_response.get('code') == '000':
-                _LOGGER.info("Legacy toggle control successful!")
-                return True
-        except Exception as e:
-            _LOGGER.debug(f"Legacy toggle failed: {e}")
+        # PRIORITÉ 2: Bluetooth BLE direct (si appareil Bluetooth et bleak disponible)
+        if self.is_bluetooth_device and self.bluetooth_support:
+            cascade.append({"method": "ble_direct"})
+        
+        # PRIORITÉ 3: Méthodes legacy en fallback
+        if on and pwm > 0:
+            cascade.append({"method": "legacy_brightness"})
+        cascade.append({"method": "legacy_toggle"})
         
         # PRIORITÉ 4: Formats alternatifs en dernière chance
-        _LOGGER.warning("All standard methods failed, trying alternative formats...")
+        if pid:
+            cascade.extend({"method": method} for method in ALTERNATIVE_CONTROL_FORMATS)
         
-        alternative_success = await self._try_alternative_control_formats(on, pwm, pid)
-        if alternative_success:
-            _LOGGER.info("Alternative format control successful!")
+        return cascade
+
+    async def _ensure_cloud_activation(self, pid: str):
+        """Activer l'appareil pour le cloud, sauf si une activation récente est connue"""
+        activated_at = self._activated_at.get(pid)
+        if activated_at is not None and time.monotonic() - activated_at < self.activation_ttl:
+            self.activations_skipped += 1
+            _LOGGER.debug(f"Device {pid} already activated, skipping setDeviceActiveV")
+            return
+        
+        try:
+            activation_success = await self._activate_device_for_cloud()
+            if activation_success:
+                self._activated_at[pid] = time.monotonic()
+                _LOGGER.info("Device activation successful")
+                await asyncio.sleep(ACTIVATION_SETTLE_DELAY)  # Attendre que l'activation prenne effet
+            else:
+                _LOGGER.warning("Device activation failed, trying control anyway...")
+        except Exception as e:
+            _LOGGER.warning(f"Device activation error: {e}")
+
+    @staticmethod
+    def _failure_suggests_deactivation(results):
+        """True si le cloud a répondu mais refusé cette commande (appareil désactivé ?)"""
+        return any(
+            result["response"] and result["response"].get('code') != '000'
+            for result in results
+        )
+
+    async def _attempt_control_strategy(self, strategy, on: bool, pwm: int, pid: str, started_at: float):
+        """Exécuter un chemin ; si l'activation en cache semble perdue, ré-activer et réessayer une fois"""
+        success, results = await self._run_control_strategy(strategy, on, pwm, pid)
+        if success:
             return True
         
-        _LOGGER.error("ALL CONTROL METHODS FAILED - device may be offline or needs WiFi configuration")
-        _LOGGER.info("RECOMMENDATION: Configure device to WiFi mode using configure_wifi_marspro.py")
+        activated_at = self._activated_at.get(pid)
+        if (
+            strategy["method"] == "cloud_pid"
+            and activated_at is not None
+            and activated_at < started_at
+            and self._failure_suggests_deactivation(results)
+        ):
+            _LOGGER.info(f"Command refused with cached activation for {pid}, re-activating...")
+            self._activated_at.pop(pid, None)
+            await self._ensure_cloud_activation(pid)
+            success, _ = await self._run_control_strategy(strategy, on, pwm, pid)
+            return success
+        
         return False
 
+    async def _run_control_strategy(self, strategy, on: bool, pwm: int, pid: str):
+        """Exécuter un chemin de contrôle.
+
+        Retourne (succès, résultats) ; les résultats du pipeline ne sont
+        fournis que par le chemin cloud_pid.
+        """
+        method = strategy["method"]
+        try:
+            if method == "cloud_pid":
+                if not pid:
+                    return False, []
+                return await self._submit_pid_command(pid, on, pwm)
+            
+            if method == "ble_direct":
+                return await self._ble_control_device(
+                    on, pwm, strategy.get("ble_char"), strategy.get("ble_frame")
+                ), []
+            
+            if method == "legacy_brightness":
+                legacy_response = await self.set_brightness(pwm)
+                return bool(legacy_response) and legacy_response.get('code') == '000', []
+            
+            if method == "legacy_toggle":
+                toggle_response = await self.toggle_switch(not on, pid or "")
+                return bool(toggle_response) and toggle_response.get('code') == '000', []
+            
+            if method in ALTERNATIVE_CONTROL_FORMATS:
+                return await self._send_alternative_control_format(method, on, pwm, pid), []
+            
+        except Exception as e:
+            _LOGGER.debug(f"Control strategy {method} failed: {e}")
+        return False, []
+
+    async def _learn_control_strategy(self, pid: str, kind: str, strategy):
+        """Mémoriser (et persister) le chemin qui a fonctionné pour ce PID et ce type de commande"""
+        if not pid:
+            return
+        if kind == "brightness" and strategy["method"] in PWM_LESS_CONTROL_METHODS:
+            # A allumé l'appareil sans pouvoir régler la luminosité : ne pas l'apprendre
+            _LOGGER.debug(f"Not learning {strategy['method']} for brightness commands on {pid}")
+            return
+        
+        learned = {"method": strategy["method"]}
+        if strategy["method"] == "ble_direct" and self.last_ble_strategy:
+            learned["ble_char"], learned["ble_frame"] = self.last_ble_strategy
+        
+        strategies = self.control_strategies.setdefault(pid, {})
+        if strategies.get(kind) != learned:
+            strategies[kind] = learned
+            await self._save_store()
+
+    async def _forget_control_strategy(self, pid: str, kind: str):
+        """Oublier le chemin appris pour ce PID et ce type de commande (il a échoué)"""
+        strategies = self.control_strategies.get(pid, {})
+        if strategies.pop(kind, None) is not None:
+            if not strategies:
+                del self.control_strategies[pid]
+            await self._save_store()
+
     async def _activate_device_for_cloud(self):
         """Activer l'appareil pour le cloud (setDeviceActiveV)"""
         try:
+            # userId depuis le profil en cache (disponible même avec un token restauré)
+            if not self.user_id:
+                await self.get_profile(force=True)
+            if not self.user_id:
+                _LOGGER.error("Device activation failed: unknown account userId")
+                return False
+
             activation = {
                 "method": "setDeviceActiveV",
                 "params": {
@@ -936,7 +2020,7 @@ class MarsProAPI:
                 }
             }
             
-            payload = {"data": json.dumps(activation)}
+            payload = {"data": json_dumps(activation)}
             response = await self._make_request("/api/upData/device", payload)
             
             return response and response.get('code') == '000'
@@ -945,14 +2029,14 @@ class MarsProAPI:
             _LOGGER.error(f"Device activation failed: {e}")
             return False
 
-    async def _try_alternative_control_formats(self, on: bool, pwm: int, pid: str):
-        """Essayer des formats de contrôle alternatifs"""
+    async def _send_alternative_control_format(self, method: str, on: bool, pwm: int, pid: str):
+        """Essayer un format de contrôle alternatif"""
         if not pid:
             return False
         
-        # Format 1: upDataStatus (vu dans certaines captures)
-        try:
-            alt_format_1 = {
+        if method == "alt_upDataStatus":
+            # Format 1: upDataStatus (vu dans certaines captures)
+            command = {
                 "method": "upDataStatus",
                 "params": {
                     "pid": pid,
@@ -962,18 +2046,9 @@ class MarsProAPI:
                     "connect": 1
                 }
             }
-            
-            payload = {"data": json.dumps(alt_format_1)}
-            response = await self._make_request("/api/upData/device", payload)
-            
-            if response and response.get('code') == '000':
-                return True
-        except:
-            pass
-        
-        # Format 2: deviceControl simple
-        try:
-            alt_format_2 = {
+        elif method == "alt_deviceControl":
+            # Format 2: deviceControl simple
+            command = {
                 "method": "deviceControl",
                 "params": {
                     "deviceId": pid,
@@ -981,18 +2056,9 @@ class MarsProAPI:
                     "brightness": pwm
                 }
             }
-            
-            payload = {"data": json.dumps(alt_format_2)}
-            response = await self._make_request("/api/upData/device", payload)
-            
-            if response and response.get('code') == '000':
-                return True
-        except:
-            pass
-        
-        # Format 3: lightControl
-        try:
-            alt_format_3 = {
+        else:
+            # Format 3: lightControl
+            command = {
                 "method": "lightControl",
                 "params": {
                     "pid": pid,
@@ -1001,13 +2067,11 @@ class MarsProAPI:
                     "channel": 0
                 }
             }
-            
-            payload = {"data": json.dumps(alt_format_3)}
+        
+        try:
+            payload = {"data": json_dumps(command)}
             response = await self._make_request("/api/upData/device", payload)
             
-            if response and response.get('code') == '000':
-                return True
-        except:
-            pass
-        
-        return False 
\ No newline at end of file
+            return bool(response) and response.get('code') == '000'
+        except Exception:
+            return False
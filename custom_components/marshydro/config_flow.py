@@ -7,12 +7,20 @@ from typing import Any
 import voluptuous as vol
 
 from homeassistant import config_entries
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.data_entry_flow import FlowResult
 from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
 from homeassistant.components import bluetooth
 
-from .const import DOMAIN
+from .const import (
+    CONF_HEDGE_READS,
+    CONF_MAX_POLL_INTERVAL,
+    CONF_MIN_POLL_INTERVAL,
+    DEFAULT_MAX_POLL_INTERVAL,
+    DEFAULT_MIN_POLL_INTERVAL,
+    DOMAIN,
+)
 from .api_marspro import MarsProAPI
 
 _LOGGER = logging.getLogger(__name__)
@@ -30,8 +38,8 @@ async def validate_input(hass: HomeAssistant, data: dict[str, Any]) -> dict[str,
     email = data["email"]
     password = data["password"]
 
-    # Test de connexion
-    api = MarsProAPI(email, password)
+    # Test de connexion (session HTTP partagée de Home Assistant)
+    api = MarsProAPI(email, password, session=async_get_clientsession(hass))
     
     try:
         await api.login()
@@ -58,6 +66,12 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
     VERSION = 1
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        """Options du mode cloud / hybride (polling, lectures couvertes)."""
+        return OptionsFlowHandler()
+
     async def async_step_user(self, user_input=None):
         """Handle the initial step."""
         errors = {}
@@ -90,7 +104,7 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             password = user_input["password"]
 
             # Test login
-            api = MarsProAPI(email, password)
+            api = MarsProAPI(email, password, session=async_get_clientsession(self.hass))
             try:
                 login_success = await api.login()
                 if login_success:
@@ -234,6 +248,45 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             return "⚠️ Bluetooth BLE non disponible - Seuls les appareils WiFi/cloud seront supportés"
 
 
+class OptionsFlowHandler(config_entries.OptionsFlow):
+    """Options MarsHydro : bornes du polling adaptatif et lectures couvertes."""
+
+    async def async_step_init(self, user_input=None):
+        """Gérer les options."""
+        if self.config_entry.data.get("mode") == "ble_pure":
+            return self.async_abort(reason="no_options")
+
+        errors = {}
+        if user_input is not None:
+            if user_input[CONF_MIN_POLL_INTERVAL] > user_input[CONF_MAX_POLL_INTERVAL]:
+                errors["base"] = "invalid_poll_bounds"
+            else:
+                return self.async_create_entry(title="", data=user_input)
+
+        options = self.config_entry.options
+        return self.async_show_form(
+            step_id="init",
+            data_schema=vol.Schema({
+                vol.Required(
+                    CONF_MIN_POLL_INTERVAL,
+                    default=options.get(
+                        CONF_MIN_POLL_INTERVAL, int(DEFAULT_MIN_POLL_INTERVAL.total_seconds())
+                    ),
+                ): vol.All(vol.Coerce(int), vol.Range(min=1, max=3600)),
+                vol.Required(
+                    CONF_MAX_POLL_INTERVAL,
+                    default=options.get(
+                        CONF_MAX_POLL_INTERVAL, int(DEFAULT_MAX_POLL_INTERVAL.total_seconds())
+                    ),
+                ): vol.All(vol.Coerce(int), vol.Range(min=1, max=86400)),
+                vol.Required(
+                    CONF_HEDGE_READS, default=options.get(CONF_HEDGE_READS, False)
+                ): bool,
+            }),
+            errors=errors,
+        )
+
+
 class CannotConnect(HomeAssistantError):
     """Error to indicate we cannot connect."""
 
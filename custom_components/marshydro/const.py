@@ -1,3 +1,18 @@
+from datetime import timedelta
+
 DOMAIN = "marshydro"
 CONF_USERNAME = "username"
-CONF_PASSWORD = "password"
\ No newline at end of file
+CONF_PASSWORD = "password"
+
+# Bornes de l'intervalle de rafraîchissement adaptatif (options, en secondes)
+CONF_MIN_POLL_INTERVAL = "min_poll_interval"
+CONF_MAX_POLL_INTERVAL = "max_poll_interval"
+DEFAULT_MIN_POLL_INTERVAL = timedelta(seconds=5)
+DEFAULT_MAX_POLL_INTERVAL = timedelta(minutes=5)
+
+# Lectures couvertes MarsPro / legacy (option)
+CONF_HEDGE_READS = "hedge_reads"
+
+# Stockage persistant (.storage) par entrée de configuration
+STORAGE_VERSION = 1
+STORAGE_KEY = f"{DOMAIN}.{{entry_id}}"
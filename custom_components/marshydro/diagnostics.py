@@ -0,0 +1,43 @@
+"""Diagnostics de l'intégration MarsHydro."""
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import CONF_PASSWORD, DOMAIN
+
+TO_REDACT = {CONF_PASSWORD, "email", "token"}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+
+    diagnostics = {
+        "entry": async_redact_data(dict(entry.data), TO_REDACT),
+        "options": dict(entry.options),
+        "update_interval": coordinator.update_interval.total_seconds(),
+    }
+
+    # Coordinateur cloud / hybride : polling adaptatif, diff, BLE et requêtes
+    if hasattr(coordinator, 'api'):
+        next_scan = coordinator.next_ble_scan
+        diagnostics.update({
+            "polling": coordinator.poll_status,
+            "devices": {
+                "count": len(coordinator.devices),
+                "last_diff": coordinator.last_diff,
+            },
+            "ble": {
+                "scan_failures": coordinator.ble_scan_failures,
+                "next_scan": next_scan.isoformat() if next_scan else None,
+            },
+            "requests": coordinator.api.request_stats,
+        })
+
+    return diagnostics
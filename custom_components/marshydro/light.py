@@ -7,7 +7,7 @@ import asyncio
 
 from homeassistant.components.light import ATTR_BRIGHTNESS, ColorMode, LightEntity
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
@@ -25,44 +25,54 @@ async def async_setup_entry(
     """Set up MarsHydro lights from a config entry."""
     coordinator = hass.data[DOMAIN][config_entry.entry_id]
     
-    # Attendre que le coordinateur récupère les données
-    await coordinator.async_config_entry_first_refresh()
-    
-    lights = []
-    
-    # Créer entités pour les appareils de type "light"
-    light_devices = coordinator.get_devices_by_type("light")
-    
-    for device in light_devices:
-        device_id = device['id']
-        device_name = device['name']
-        device_pid = device['pid']
-        is_bluetooth = device.get('is_bluetooth', False)
-        mode = device.get('mode', 'cloud')
+    # Le premier rafraîchissement a déjà eu lieu dans async_setup_entry
+    known_ids = set()
+
+    def _create_lights():
+        """Créer les entités des appareils "light" pas encore ajoutés."""
+        lights = []
         
-        _LOGGER.info(f"Creating light entity for {device_name} (ID: {device_id}, PID: {device_pid})")
+        # Créer entités pour les appareils de type "light"
+        light_devices = coordinator.get_devices_by_type("light")
         
-        if mode == 'ble_pure':
-            # Mode BLE pur
-            _LOGGER.info(f"Device {device_name} uses BLE PURE model (Bluetooth direct)")
-            light_entity = MarsHydroBLEPureLight(coordinator, device)
-        elif is_bluetooth:
-            # Appareil hybride: Cloud + BLE requis
-            _LOGGER.info(f"Device {device_name} uses HYBRID model (Cloud API + BLE)")
-            light_entity = MarsHydroHybridLight(coordinator, device)
-        else:
-            # Appareil cloud seul
-            _LOGGER.info(f"Device {device_name} uses Cloud-only model")
-            light_entity = MarsHydroCloudLight(coordinator, device)
+        for device in light_devices:
+            device_id = device['id']
+            if device_id in known_ids:
+                continue
+            known_ids.add(device_id)
+            device_name = device['name']
+            device_pid = device['pid']
+            is_bluetooth = device.get('is_bluetooth', False)
+            mode = device.get('mode', 'cloud')
+            
+            _LOGGER.info(f"Creating light entity for {device_name} (ID: {device_id}, PID: {device_pid})")
+            
+            if mode == 'ble_pure':
+                # Mode BLE pur
+                _LOGGER.info(f"Device {device_name} uses BLE PURE model (Bluetooth direct)")
+                light_entity = MarsHydroBLEPureLight(coordinator, device)
+            elif is_bluetooth:
+                # Appareil hybride: Cloud + BLE requis
+                _LOGGER.info(f"Device {device_name} uses HYBRID model (Cloud API + BLE)")
+                light_entity = MarsHydroHybridLight(coordinator, device)
+            else:
+                # Appareil cloud seul
+                _LOGGER.info(f"Device {device_name} uses Cloud-only model")
+                light_entity = MarsHydroCloudLight(coordinator, device)
+            
+            lights.append(light_entity)
         
-        lights.append(light_entity)
-    
-    if lights:
-        _LOGGER.info(f"Adding {len(lights)} MarsHydro light entities")
-        async_add_entities(lights)
-    else:
+        if lights:
+            _LOGGER.info(f"Adding {len(lights)} MarsHydro light entities")
+            async_add_entities(lights)
+        return lights
+
+    if not _create_lights():
         _LOGGER.warning("No light devices found to add")
 
+    # Grands comptes : les pages suivantes de la liste arrivent après la première
+    config_entry.async_on_unload(coordinator.async_add_listener(_create_lights))
+
 
 class MarsHydroBaseLight(CoordinatorEntity, LightEntity):
     """Base class for MarsHydro lights."""
@@ -87,6 +97,9 @@ class MarsHydroBaseLight(CoordinatorEntity, LightEntity):
         self._attr_brightness = 128
         self._attr_is_on = False
         
+        # Disponibilité et attributs runtime au dernier état écrit
+        self._last_written = None
+        
         _LOGGER.info(f"Initialized {self.__class__.__name__}: {self._attr_name}")
 
     @property
@@ -109,8 +122,47 @@ class MarsHydroBaseLight(CoordinatorEntity, LightEntity):
             "device_name": self.device_name,
             "integration_version": "2.3.0-final",
         }
+        
+        attributes.update(self._runtime_attributes())
         return attributes
 
+    def _runtime_attributes(self) -> dict[str, Any]:
+        """Attributs qui évoluent sans que l'appareil lui-même change."""
+        attributes = {}
+        # État du disjoncteur cloud (absent en mode BLE pur)
+        api = getattr(self.coordinator, 'api', None)
+        if api is not None:
+            attributes["cloud_circuit"] = api.circuit_breaker.state
+            strategies = api.control_strategies.get(self.device_pid, {})
+            attributes["control_strategy"] = {
+                kind: strategy["method"] for kind, strategy in strategies.items()
+            } or None
+        
+        # Re-scan BLE planifié (backoff) du coordinateur hybride
+        if hasattr(self.coordinator, 'ble_scan_failures'):
+            next_scan = self.coordinator.next_ble_scan
+            attributes["ble_scan_failures"] = self.coordinator.ble_scan_failures
+            attributes["next_ble_scan"] = next_scan.isoformat() if next_scan else None
+        return attributes
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """N'écrire l'état que si l'appareil, la disponibilité ou l'état runtime a changé."""
+        changed = getattr(self.coordinator, 'changed_device_ids', None)
+        written = (self.coordinator.last_update_success, self._runtime_attributes())
+        if (
+            changed is not None
+            and self.device_id not in changed
+            and written == self._last_written
+        ):
+            return
+        self._last_written = written
+        if changed is not None and self.device_id in changed:
+            device = self.coordinator.get_device(self.device_id)
+            if device is not None:
+                self.device = device
+        super()._handle_coordinator_update()
+
 
 class MarsHydroCloudLight(MarsHydroBaseLight):
     """MarsHydro light avec contrôle Cloud uniquement."""
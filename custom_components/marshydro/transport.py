@@ -0,0 +1,558 @@
+"""Briques de transport partagées par les clients MarsPro et MarsHydro legacy."""
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+# Sérialisation JSON rapide si orjson est disponible (fourni par Home Assistant)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_LOGGER = logging.getLogger(__name__)
+
+# Classes de priorité de l'ordonnanceur (plus petit = plus prioritaire)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+_REQUEST_PRIORITY = ContextVar("marshydro_request_priority", default=PRIORITY_BACKGROUND)
+
+
+@contextmanager
+def interactive_priority():
+    """Marquer les requêtes émises dans ce bloc comme commandes utilisateur"""
+    token = _REQUEST_PRIORITY.set(PRIORITY_INTERACTIVE)
+    try:
+        yield
+    finally:
+        _REQUEST_PRIORITY.reset(token)
+
+
+def interactive_command(func):
+    """Décorateur : les requêtes d'une commande utilisateur passent devant le polling"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with interactive_priority():
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+def is_background_request():
+    """True si la requête courante relève du polling en arrière-plan"""
+    return _REQUEST_PRIORITY.get() == PRIORITY_BACKGROUND
+
+
+def create_background_task(coro, name=None):
+    """Créer une tâche de fond qui n'hérite pas de la priorité de l'appelant.
+
+    Une tâche lancée depuis une commande utilisateur copierait sinon la
+    priorité interactive pour toute sa durée de vie.
+    """
+    context = contextvars.copy_context()
+    context.run(_REQUEST_PRIORITY.set, PRIORITY_BACKGROUND)
+    return asyncio.get_running_loop().create_task(coro, name=name, context=context)
+
+
+# Encodeurs de repli réutilisés (json.dumps avec options en recrée un à chaque appel)
+_JSON_ENCODER = json.JSONEncoder(separators=(",", ":"), default=str)
+_JSON_SORTED_ENCODER = json.JSONEncoder(separators=(",", ":"), default=str, sort_keys=True)
+
+
+def json_dumps(obj, sort_keys=False):
+    """Sérialiser en JSON compact (comme l'app), via orjson si disponible"""
+    if orjson is not None:
+        option = orjson.OPT_SORT_KEYS if sort_keys else 0
+        return orjson.dumps(obj, default=str, option=option).decode()
+    return (_JSON_SORTED_ENCODER if sort_keys else _JSON_ENCODER).encode(obj)
+
+
+def json_loads(data):
+    """Désérialiser du JSON, via orjson si disponible"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def request_key(endpoint, payload):
+    """Construire une clé stable (endpoint + payload) pour identifier une requête"""
+    return endpoint, json_dumps(payload, sort_keys=True)
+
+
+class SystemDataTemplate:
+    """En-tête systemdata pré-sérialisé : seuls reqId, timestamp et token varient.
+
+    Les champs statiques (version de l'app, appareil, fuseau...) sont encodés
+    une seule fois ; le token encodé est mémorisé jusqu'à son changement.
+    """
+
+    def __init__(self, static_fields):
+        self.static_fields = dict(static_fields)
+        self._static = json_dumps(self.static_fields)[1:-1]
+        self._token = None
+        self._token_json = ""
+
+    def render(self, req_id, token=None):
+        """Construire la valeur de l'en-tête systemdata pour une requête"""
+        if token != self._token:
+            self._token = token
+            self._token_json = f',"token":{json_dumps(token)}' if token else ""
+        return (
+            f'{{"reqId":"{req_id}",{self._static},'
+            f'"timestamp":"{int(time.time())}"{self._token_json}}}'
+        )
+
+
+class _Flight:
+    """Requête partagée en vol et nombre d'appelants qui l'attendent."""
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Partager une même requête en vol entre tous les appelants concurrents.
+
+    Le premier appelant pour une clé lance la requête dans sa propre tâche ;
+    les suivants attendent son résultat au lieu d'envoyer une requête
+    identique. L'annulation d'un appelant ne touche pas les autres : la
+    requête n'est annulée que si plus personne ne l'attend.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def run(self, key, func, *args, **kwargs):
+        """Exécuter func une seule fois par clé tant qu'une requête est en vol"""
+        self.calls += 1
+
+        flight = self._inflight.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(func(*args, **kwargs)))
+            self._inflight[key] = flight
+            flight.task.add_done_callback(lambda _task: self._forget(key, flight))
+        else:
+            self.coalesced += 1
+            _LOGGER.debug(f"Request coalesced with in-flight call: {key[0]}")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                # Dernier appelant annulé : la requête n'a plus de destinataire
+                flight.task.cancel()
+
+    def _forget(self, key, flight):
+        """Requête terminée : le prochain appelant en relancera une nouvelle"""
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+
+    @property
+    def stats(self):
+        """Compteurs de coalescence"""
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+        }
+
+
+class TTLCache:
+    """Cache LRU borné dont chaque entrée expire après son propre TTL."""
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Retourner la valeur si présente et non expirée, sinon None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            # Gardée (dans la limite LRU) pour get_stale
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def get_stale(self, key):
+        """Retourner la dernière valeur connue, même expirée"""
+        entry = self._entries.get(key)
+        return entry[1] if entry is not None else None
+
+    def set(self, key, value, ttl):
+        """Mémoriser une valeur pour ttl secondes en évinçant la plus ancienne si plein"""
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, endpoint=None):
+        """Vider le cache, entièrement ou pour un seul endpoint"""
+        if endpoint is None:
+            self._entries.clear()
+            return
+        for key in [key for key in self._entries if key[0] == endpoint]:
+            del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def stats(self):
+        """Compteurs du cache"""
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class _CoalescerSlot:
+    """État d'une clé du coalesceur : valeur en attente et dernier envoi."""
+
+    def __init__(self):
+        self.value = None
+        self.send = None
+        self.future = None
+        self.task = None
+        self.last_sent = 0.0
+
+
+class LatestValueCoalescer:
+    """Coalescer les commandes par (appareil, attribut) : la dernière valeur gagne.
+
+    Une commande part immédiatement si rien n'est en cours ; pendant qu'une
+    commande est en vol (ou dans la fenêtre de debounce qui suit un envoi), les
+    nouvelles valeurs remplacent la valeur en attente et seule la plus récente
+    est envoyée. Les appelants remplacés reçoivent le résultat de cette dernière.
+    """
+
+    def __init__(self, debounce=0.25):
+        self.debounce = debounce
+        self._slots = {}
+        self.submitted = 0
+        self.superseded = 0
+
+    async def submit(self, key, value, send):
+        """Demander l'envoi de send(value) pour cette clé et attendre le résultat"""
+        self.submitted += 1
+
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = _CoalescerSlot()
+
+        if slot.future is not None:
+            self.superseded += 1
+            _LOGGER.debug(f"Queued command for {key} superseded by a newer value")
+        else:
+            slot.future = asyncio.get_running_loop().create_future()
+        slot.value = value
+        slot.send = send
+        future = slot.future
+
+        if slot.task is None or slot.task.done():
+            slot.task = asyncio.create_task(self._drain(slot))
+
+        return await asyncio.shield(future)
+
+    async def _drain(self, slot):
+        """Envoyer la valeur en attente la plus récente tant qu'il y en a une"""
+        loop = asyncio.get_running_loop()
+        try:
+            while slot.future is not None:
+                delay = slot.last_sent + self.debounce - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                future, value, send = slot.future, slot.value, slot.send
+                slot.future = None
+                slot.last_sent = loop.time()
+
+                try:
+                    result = await send(value)
+                except asyncio.CancelledError:
+                    future.cancel()
+                    raise
+                except Exception as err:
+                    future.set_exception(err)
+                    future.exception()
+                else:
+                    future.set_result(result)
+        except asyncio.CancelledError:
+            if slot.future is not None:
+                slot.future.cancel()
+                slot.future = None
+            raise
+
+    def cancel(self):
+        """Annuler les envois en attente (déchargement de l'intégration)"""
+        for slot in self._slots.values():
+            if slot.task is not None and not slot.task.done():
+                slot.task.cancel()
+
+    @property
+    def stats(self):
+        """Compteurs du coalesceur"""
+        return {"submitted": self.submitted, "superseded": self.superseded}
+
+
+class RequestScheduler:
+    """Ordonnanceur de requêtes partagé par les clients d'un même compte.
+
+    - limite de concurrence commune à tout le compte ;
+    - les lectures ne peuvent occuper que max_concurrency - 1 créneaux, un
+      créneau reste donc toujours libre pour les écritures ;
+    - les écritures sur un même appareil sont sérialisées, celles sur des
+      appareils différents partent en parallèle ;
+    - deux classes de priorité : les commandes utilisateur (interactives)
+      passent devant le polling en attente (arrière-plan).
+    """
+
+    def __init__(self, max_concurrency=4):
+        self.max_concurrency = max_concurrency
+        self.max_reads = max(1, max_concurrency - 1)
+        self._active = 0
+        self._active_reads = 0
+        self._active_interactive = 0
+        self._waiters = {PRIORITY_INTERACTIVE: deque(), PRIORITY_BACKGROUND: deque()}
+        self._device_locks = {}
+        self.deferred = 0
+
+    @property
+    def interactive_pending(self):
+        """True si des commandes interactives sont en cours ou en attente"""
+        return self._active_interactive > 0 or bool(self._waiters[PRIORITY_INTERACTIVE])
+
+    def read_slot(self, priority=None):
+        """Créneau pour une requête de lecture (polling, liste d'appareils)"""
+        return self._slot(True, priority)
+
+    def write_slot(self, priority=None):
+        """Créneau pour une requête d'écriture (commande, login)"""
+        return self._slot(False, priority)
+
+    @asynccontextmanager
+    async def _slot(self, is_read, priority):
+        if priority is None:
+            priority = _REQUEST_PRIORITY.get()
+        await self._acquire(is_read, priority)
+        try:
+            yield
+        finally:
+            self._release(is_read, priority)
+
+    def _can_run(self, is_read):
+        if self._active >= self.max_concurrency:
+            return False
+        return not is_read or self._active_reads < self.max_reads
+
+    def _grant(self, is_read, priority):
+        self._active += 1
+        if is_read:
+            self._active_reads += 1
+        if priority == PRIORITY_INTERACTIVE:
+            self._active_interactive += 1
+
+    async def _acquire(self, is_read, priority):
+        waiter = (asyncio.get_running_loop().create_future(), is_read)
+        self._waiters[priority].append(waiter)
+        self._wake()
+        if waiter[0].done():
+            return
+
+        if priority == PRIORITY_BACKGROUND and self.interactive_pending:
+            self.deferred += 1
+
+        try:
+            await waiter[0]
+        except asyncio.CancelledError:
+            if waiter[0].done() and not waiter[0].cancelled():
+                # Créneau accordé juste avant l'annulation : le rendre
+                self._release(is_read, priority)
+            else:
+                # _wake peut avoir déjà retiré le futur annulé de la file
+                queue = self._waiters[priority]
+                if waiter in queue:
+                    queue.remove(waiter)
+            raise
+
+    def _release(self, is_read, priority):
+        self._active -= 1
+        if is_read:
+            self._active_reads -= 1
+        if priority == PRIORITY_INTERACTIVE:
+            self._active_interactive -= 1
+        self._wake()
+
+    def _wake(self):
+        """Accorder les créneaux libres, priorité interactive d'abord (FIFO par classe)"""
+        for priority in sorted(self._waiters):
+            queue = self._waiters[priority]
+            for waiter in list(queue):
+                future, is_read = waiter
+                if not self._can_run(is_read):
+                    if self._active >= self.max_concurrency:
+                        return
+                    continue  # Lecture bloquée : laisser passer les écritures derrière
+                queue.remove(waiter)
+                if not future.done():
+                    self._grant(is_read, priority)
+                    future.set_result(None)
+
+    def device_lock(self, device_key):
+        """Verrou sérialisant les écritures d'un appareil"""
+        lock = self._device_locks.get(device_key)
+        if lock is None:
+            lock = self._device_locks[device_key] = asyncio.Lock()
+        return lock
+
+    @property
+    def stats(self):
+        """Compteurs de l'ordonnanceur"""
+        return {
+            "active": self._active,
+            "waiting_interactive": len(self._waiters[PRIORITY_INTERACTIVE]),
+            "waiting_background": len(self._waiters[PRIORITY_BACKGROUND]),
+            "deferred_polls": self.deferred,
+        }
+
+
+class CircuitBreaker:
+    """Disjoncteur : échouer immédiatement tant que le cloud est indisponible.
+
+    Après failure_threshold échecs de transport consécutifs, le circuit s'ouvre
+    pendant reset_timeout secondes ; il passe ensuite en demi-ouvert, où une
+    seule requête sert de sonde (succès : fermé, échec : ré-ouvert). Les autres
+    sont rejetées tant que la sonde est en vol, ou jusqu'à ce qu'elle soit
+    considérée perdue (sans issue enregistrée après reset_timeout secondes).
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.rejected = 0
+        self._probe_started = None
+
+    @property
+    def state(self):
+        """État courant du circuit"""
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow_request(self):
+        """True si une requête peut partir (circuit fermé ou sonde demi-ouverte)"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+
+        now = time.monotonic()
+        if state == self.HALF_OPEN and (
+            self._probe_started is None or now - self._probe_started >= self.reset_timeout
+        ):
+            self._probe_started = now
+            _LOGGER.debug("Circuit half-open, sending a probe request")
+            return True
+
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        """Le cloud a répondu : refermer le circuit"""
+        if self.opened_at is not None:
+            _LOGGER.info("Cloud reachable again, circuit closed")
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probe_started = None
+
+    def record_failure(self):
+        """Échec de transport : ouvrir le circuit au-delà du seuil"""
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or (
+            self.opened_at is None and self.consecutive_failures >= self.failure_threshold
+        ):
+            _LOGGER.warning(
+                f"Cloud unreachable after {self.consecutive_failures} failures, "
+                f"circuit open for {self.reset_timeout}s"
+            )
+            self.opened_at = time.monotonic()
+        self._probe_started = None
+
+    @property
+    def stats(self):
+        """Compteurs du disjoncteur"""
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "rejected": self.rejected,
+        }
+
+
+class LatencyTracker:
+    """Fenêtre glissante des latences observées, par clé (endpoint, backend...).
+
+    Seules les window dernières mesures sont conservées ; les percentiles sont
+    calculés à la demande (rang le plus proche), ce qui suffit pour quelques
+    dizaines d'échantillons.
+    """
+
+    def __init__(self, window=100):
+        self.window = window
+        self._samples = {}
+
+    def record(self, key, seconds):
+        """Enregistrer une latence (en secondes) pour la clé"""
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def count(self, key):
+        """Nombre d'échantillons disponibles pour la clé"""
+        return len(self._samples.get(key, ()))
+
+    def percentile(self, key, q, default=None):
+        """Percentile q (0-100) des latences de la clé, ou default sans mesure"""
+        samples = self._samples.get(key)
+        if not samples:
+            return default
+        ordered = sorted(samples)
+        rank = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered)) - 1))
+        return ordered[rank]
+
+    @property
+    def stats(self):
+        """p50 / p95 / p99 (en millisecondes) et nombre d'échantillons par clé"""
+        return {
+            key: {
+                "count": len(samples),
+                **{
+                    f"p{q}": round(self.percentile(key, q) * 1000, 1)
+                    for q in (50, 95, 99)
+                },
+            }
+            for key, samples in self._samples.items()
+        }
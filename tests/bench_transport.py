@@ -0,0 +1,69 @@
+"""Microbenchmark de l'en-tête systemdata et des payloads de commande.
+
+Compare la construction historique (dict + json.dumps à chaque requête) au
+gabarit pré-sérialisé SystemDataTemplate et à transport.json_dumps (orjson
+si installé, encodeurs stdlib réutilisés sinon).
+
+    python tests/bench_transport.py [itérations]
+"""
+import importlib.util
+import itertools
+import json
+import random
+import sys
+import time
+import timeit
+from pathlib import Path
+
+_PATH = Path(__file__).parents[1] / "custom_components" / "marshydro" / "transport.py"
+_SPEC = importlib.util.spec_from_file_location("marshydro_transport", _PATH)
+transport = importlib.util.module_from_spec(_SPEC)
+_SPEC.loader.exec_module(transport)
+
+# Champs statiques de l'en-tête : SYSTEMDATA_STATIC et PROFILE_DEFAULTS (api_marspro.py)
+STATIC_FIELDS = {
+    "appVersion": "1.3.2",
+    "osType": "android",
+    "osVersion": "15",
+    "deviceType": "SM-S928B",
+    "deviceId": "AP3A.240905.015.A2",
+    "netType": "wifi",
+    "wifiName": "unknown",
+    "timezone": "34",
+    "language": "French",
+}
+TOKEN = "tok" * 20
+COMMAND = {"method": "outletCtrl", "pid": "345F45EC73CC", "msgId": 1, "params": {"pwm": 50, "on": 1}}
+
+
+def header_dict():
+    """Construction historique : dict complet sérialisé à chaque requête"""
+    return json.dumps({
+        "reqId": str(random.randint(10000000000, 99999999999)),
+        **STATIC_FIELDS,
+        "timestamp": str(int(time.time())),
+        "token": TOKEN,
+    })
+
+
+def main(number):
+    template = transport.SystemDataTemplate(STATIC_FIELDS)
+    req_ids = itertools.count(random.randint(10000000000, 99999999999))
+
+    cases = [
+        ("systemdata header, dict + json.dumps", header_dict),
+        ("systemdata header, SystemDataTemplate", lambda: template.render(next(req_ids), TOKEN)),
+        ("command payload, json.dumps", lambda: json.dumps({"data": json.dumps(COMMAND)})),
+        ("command payload, transport.json_dumps",
+         lambda: transport.json_dumps({"data": transport.json_dumps(COMMAND)})),
+    ]
+
+    backend = "orjson" if transport.orjson is not None else "stdlib"
+    print(f"{number} iterations, best of 3, json_dumps backend: {backend}")
+    for label, func in cases:
+        best = min(timeit.repeat(func, number=number, repeat=3))
+        print(f"  {label}: {best / number * 1e6:.2f} us")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
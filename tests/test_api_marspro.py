@@ -0,0 +1,85 @@
+"""Tests du client MarsProAPI (api_marspro.py).
+
+Les modules de l'intégration sont chargés dans un paquet de substitution :
+le vrai __init__.py importe Home Assistant, absent de cet environnement.
+"""
+import asyncio
+import importlib
+import sys
+import types
+from pathlib import Path
+
+_PACKAGE = "marshydro_under_test"
+_package = types.ModuleType(_PACKAGE)
+_package.__path__ = [str(Path(__file__).parents[1] / "custom_components" / "marshydro")]
+sys.modules.setdefault(_PACKAGE, _package)
+api_marspro = importlib.import_module(f"{_PACKAGE}.api_marspro")
+
+
+def _api(results):
+    """Client dont l'envoi des commandes PID est simulé (succès / échec)"""
+    api = api_marspro.MarsProAPI("user@example.com", "secret", command_debounce=0)
+    sent = []
+
+    async def send_pid_command(pid, on, pwm=100):
+        sent.append((pid, on, pwm))
+        return results.pop(0), []
+
+    api._send_pid_command = send_pid_command
+    return api, sent
+
+
+def test_successful_command_notifies_listeners():
+    """Une commande réussie prévient les abonnés (vérification par getDeviceDetail)"""
+
+    async def scenario():
+        api, sent = _api([True, True])
+        api._remember_pids([{"id": 129245, "pid": "345F45EC73CC"}])
+        refreshed = []
+        unsubscribe = api.add_command_listener(refreshed.append)
+
+        assert await api.turn_on_device(129245, 40)
+        assert await api.turn_off_device(129245)
+        assert sent == [("345F45EC73CC", True, 40), ("345F45EC73CC", False, 100)]
+        assert refreshed == [129245, 129245]
+
+        unsubscribe()
+        await api.close()
+
+    asyncio.run(scenario())
+
+
+def test_failed_command_does_not_notify_listeners():
+    """Une commande refusée ne déclenche pas de vérification"""
+
+    async def scenario():
+        api, _ = _api([False])
+        api._remember_pids([{"id": 129245, "pid": "345F45EC73CC"}])
+        refreshed = []
+        api.add_command_listener(refreshed.append)
+
+        assert not await api.turn_on_device(129245, 40)
+        assert refreshed == []
+        await api.close()
+
+    asyncio.run(scenario())
+
+
+def test_unknown_device_pid_resolved_through_detail():
+    """Un appareil jamais listé est résolu via getDeviceDetail"""
+
+    async def scenario():
+        api, sent = _api([True])
+        details = []
+
+        async def get_device_detail(device_id, fresh=False):
+            details.append(device_id)
+            return {"id": device_id, "pid": "345F45EC73CC"}
+
+        api.get_device_detail = get_device_detail
+        assert await api.turn_off_device(42)
+        assert details == [42]
+        assert sent == [("345F45EC73CC", False, 100)]
+        await api.close()
+
+    asyncio.run(scenario())
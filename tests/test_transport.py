@@ -0,0 +1,266 @@
+"""Tests de l'ordonnanceur de requêtes (transport.py).
+
+Le module est chargé directement depuis son fichier : le paquet de
+l'intégration importe Home Assistant, absent de cet environnement de test.
+"""
+import asyncio
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+_PATH = Path(__file__).parents[1] / "custom_components" / "marshydro" / "transport.py"
+_SPEC = importlib.util.spec_from_file_location("marshydro_transport", _PATH)
+transport = importlib.util.module_from_spec(_SPEC)
+_SPEC.loader.exec_module(transport)
+
+RequestScheduler = transport.RequestScheduler
+PRIORITY_INTERACTIVE = transport.PRIORITY_INTERACTIVE
+PRIORITY_BACKGROUND = transport.PRIORITY_BACKGROUND
+
+
+async def _hold(slot, entered, release):
+    """Occuper un créneau jusqu'à ce que release soit positionné"""
+    async with slot:
+        entered.set()
+        await release.wait()
+
+
+def test_cancel_queued_read_while_slot_released():
+    """Annuler une lecture en attente et libérer le créneau dans la même étape"""
+
+    async def scenario():
+        scheduler = RequestScheduler(max_concurrency=2)  # une seule lecture
+        slot = scheduler.read_slot()
+        await slot.__aenter__()
+
+        async def queued_read():
+            async with scheduler.read_slot():
+                pass
+
+        waiter = asyncio.create_task(queued_read())
+        await asyncio.sleep(0)
+        assert scheduler.stats["waiting_background"] == 1
+
+        # _wake retire le futur annulé avant que la tâche ne reprenne la main
+        waiter.cancel()
+        await slot.__aexit__(None, None, None)
+
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert scheduler.stats["active"] == 0
+        assert scheduler.stats["waiting_background"] == 0
+
+        # L'ordonnanceur reste utilisable
+        async with scheduler.read_slot():
+            assert scheduler.stats["active"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancel_queued_request_frees_nothing():
+    """Une requête annulée en file ne consomme ni ne libère de créneau"""
+
+    async def scenario():
+        scheduler = RequestScheduler(max_concurrency=1)
+        entered, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(_hold(scheduler.write_slot(), entered, release))
+        await entered.wait()
+
+        async def queued_write():
+            async with scheduler.write_slot():
+                pass
+
+        waiter = asyncio.create_task(queued_write())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert scheduler.stats["active"] == 1
+        assert scheduler.stats["waiting_background"] == 0
+
+        release.set()
+        await holder
+        assert scheduler.stats["active"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_interactive_requests_overtake_queued_polls():
+    """Les commandes interactives passent devant le polling déjà en file"""
+
+    async def scenario():
+        scheduler = RequestScheduler(max_concurrency=1)
+        entered, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(_hold(scheduler.write_slot(), entered, release))
+        await entered.wait()
+
+        order = []
+
+        async def request(name, priority):
+            async with scheduler.write_slot(priority):
+                order.append(name)
+
+        polls = [
+            asyncio.create_task(request(f"poll{i}", PRIORITY_BACKGROUND))
+            for i in range(2)
+        ]
+        await asyncio.sleep(0)
+        command = asyncio.create_task(request("command", PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0)
+        assert scheduler.interactive_pending
+
+        release.set()
+        await asyncio.gather(holder, command, *polls)
+        assert order == ["command", "poll0", "poll1"]
+
+    asyncio.run(scenario())
+
+
+def test_write_slot_reserved_when_reads_saturate():
+    """Une écriture passe même quand toutes les lectures autorisées sont prises"""
+
+    async def scenario():
+        scheduler = RequestScheduler(max_concurrency=3)
+        release = asyncio.Event()
+        readers = []
+        for _ in range(scheduler.max_reads):
+            entered = asyncio.Event()
+            readers.append(asyncio.create_task(_hold(scheduler.read_slot(), entered, release)))
+            await entered.wait()
+
+        async def extra_read():
+            async with scheduler.read_slot():
+                pass
+
+        blocked_read = asyncio.create_task(extra_read())
+        await asyncio.sleep(0)
+        assert scheduler.stats["waiting_background"] == 1
+
+        async with scheduler.write_slot():
+            assert scheduler.stats["active"] == scheduler.max_concurrency
+        assert not blocked_read.done()
+
+        release.set()
+        await asyncio.gather(blocked_read, *readers)
+        assert scheduler.stats["active"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_single_flight_survives_owner_cancellation():
+    """L'annulation du premier appelant ne se propage pas aux appelants coalescés"""
+
+    async def scenario():
+        flight = transport.SingleFlight()
+        release = asyncio.Event()
+        sent = []
+
+        async def fetch():
+            sent.append(1)
+            await release.wait()
+            return "devices"
+
+        owner = asyncio.create_task(flight.run(("getDeviceList",), fetch))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(flight.run(("getDeviceList",), fetch))
+        await asyncio.sleep(0)
+
+        owner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        release.set()
+
+        assert await waiter == "devices"
+        assert sent == [1]
+        assert flight.stats == {"calls": 2, "coalesced": 1, "in_flight": 0}
+
+    asyncio.run(scenario())
+
+
+def test_single_flight_cancels_request_without_waiters():
+    """La requête partagée est annulée quand plus aucun appelant ne l'attend"""
+
+    async def scenario():
+        flight = transport.SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def fetch():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        callers = [
+            asyncio.create_task(flight.run(("getDeviceList",), fetch)) for _ in range(2)
+        ]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await asyncio.sleep(0)
+        assert flight.stats["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+class _Clock:
+    """Horloge monotone contrôlée par le test"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _open_breaker(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(transport.time, "monotonic", clock)
+    breaker = transport.CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+    return breaker, clock
+
+
+def test_circuit_half_open_allows_a_single_probe(monkeypatch):
+    """En demi-ouvert, une seule requête passe tant que la sonde est en vol"""
+    breaker, clock = _open_breaker(monkeypatch)
+    assert not breaker.allow_request()
+
+    clock.now += 60
+    assert breaker.state == breaker.HALF_OPEN
+    assert [breaker.allow_request() for _ in range(3)] == [True, False, False]
+
+    breaker.record_success()
+    assert breaker.state == breaker.CLOSED
+    assert all(breaker.allow_request() for _ in range(3))
+
+
+def test_circuit_failed_probe_reopens(monkeypatch):
+    """Sonde en échec : le circuit se ré-ouvre pour reset_timeout"""
+    breaker, clock = _open_breaker(monkeypatch)
+    clock.now += 60
+    assert breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+    assert not breaker.allow_request()
+
+    clock.now += 60
+    assert breaker.allow_request()
+
+
+def test_circuit_lost_probe_is_replaced(monkeypatch):
+    """Une sonde sans issue enregistrée n'empêche pas indéfiniment les requêtes"""
+    breaker, clock = _open_breaker(monkeypatch)
+    clock.now += 60
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    clock.now += 60
+    assert breaker.allow_request()
+    assert not breaker.allow_request()